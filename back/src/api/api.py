@@ -257,9 +257,10 @@ async def detect_skin_conditions(file: UploadFile = File(..., description="Image
         raise HTTPException(status_code=status_code, detail=error_message)
 
     # --- 7. Encode Heatmap Image ---
-    heatmap_base64 = None
+    # Encoded here: analyze_skin_image only returns it encoded when asked to (encode_overlay=True)
+    heatmap_base64 = analysis_results.get('heatmap_overlay_base64')
     heatmap_data = analysis_results.get('heatmap_overlay_bgr')
-    if heatmap_data is not None and isinstance(heatmap_data, np.ndarray):
+    if heatmap_base64 is None and heatmap_data is not None and isinstance(heatmap_data, np.ndarray):
         try:
             success, buffer = cv2.imencode('.png', heatmap_data) # Use PNG for lossless overlay
             if success:
@@ -22,4 +22,8 @@ ALLOWED_FILE_TYPES = ["image/jpeg", "image/png", "image/bmp"]
 MAX_FILE_SIZE = 10 * 1024 * 1024  # 10MB
 
 # Security settings
-API_PREFIX = "/api/v1" 
\ No newline at end of file
+API_PREFIX = "/api/v1"
+
+# Skin plan settings
+# Load the default plan model into Ollama at startup (PRELOAD_PLAN_MODEL=0 skips the request to Ollama)
+PRELOAD_PLAN_MODEL = os.environ.get("PRELOAD_PLAN_MODEL", "1") != "0" 
\ No newline at end of file
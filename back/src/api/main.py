@@ -1,13 +1,28 @@
+import asyncio
+from contextlib import asynccontextmanager
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
-from src.api.config.settings import ALLOWED_ORIGINS, API_PREFIX
+from src.api.config.settings import ALLOWED_ORIGINS, API_PREFIX, PRELOAD_PLAN_MODEL
 from src.api.routes import profile, detection, analysis, skin_plan, timeseries
 from src.db.user_profile_db import init_db
+from src.solutions.medllama import preload_skin_model_async, DEFAULT_PLAN_MODEL
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Load the default plan model in the background, so neither startup nor the first request waits on it
+    # (the task is kept on app.state so it isn't garbage-collected mid-flight)
+    app.state.plan_model_preload = None
+    if PRELOAD_PLAN_MODEL:
+        app.state.plan_model_preload = asyncio.create_task(preload_skin_model_async(DEFAULT_PLAN_MODEL))
+    yield
+    if app.state.plan_model_preload is not None:
+        app.state.plan_model_preload.cancel()
 
 app = FastAPI(
     title="Acne Tracker Analysis API",
     description="API for skin condition detection and analysis",
-    version="1.0.0"
+    version="1.0.0",
+    lifespan=lifespan
 )
 
 # Add CORS middleware
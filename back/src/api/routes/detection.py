@@ -36,10 +36,10 @@ async def detect_skin_conditions(file: UploadFile = File(...)):
         if not analysis_results or not analysis_results.get('success'):
             raise AnalysisError(analysis_results.get('message', 'Unknown analysis error'))
 
-        # Process heatmap image
-        heatmap_base64 = None
+        # Process heatmap image (analyze_skin_image only encodes it with encode_overlay=True)
+        heatmap_base64 = analysis_results.get('heatmap_overlay_base64')
         heatmap_data = analysis_results.get('heatmap_overlay_bgr')
-        if heatmap_data is not None and isinstance(heatmap_data, np.ndarray):
+        if heatmap_base64 is None and heatmap_data is not None and isinstance(heatmap_data, np.ndarray):
             success, buffer = cv2.imencode('.png', heatmap_data)
             if success:
                 heatmap_base64 = base64.b64encode(buffer).decode('utf-8')
@@ -1,10 +1,9 @@
 from fastapi import APIRouter, HTTPException
 from typing import Dict, Optional
 from src.api.core.exceptions import AnalysisError
-from src.solutions.medllama import generate_skin_plan_from_json, build_search_query, search_products_google
+from src.solutions.medllama import generate_skin_plan_from_json, build_search_query, search_products_google, DEFAULT_PLAN_MODEL
 from src.db.user_profile_db import get_profile_from_db
 from src.db.create_db import get_latest_timeseries_data
-import json
 from datetime import datetime
 from pathlib import Path
 import os
@@ -12,13 +11,13 @@ import os
 router = APIRouter(prefix="/skin-plan", tags=["skin-plan"])
 
 @router.post("/generate")
-async def generate_skin_plan(user_id: str, model_name: Optional[str] = "llama2"):
+async def generate_skin_plan(user_id: str, model_name: Optional[str] = DEFAULT_PLAN_MODEL):
     """
     Generate a personalized skin treatment plan based on user profile and timeseries data.
     
     Args:
         user_id: The ID of the user to generate the plan for
-        model_name: Optional name of the Ollama model to use (defaults to llama2)
+        model_name: Optional name of the Ollama model to use (defaults to DEFAULT_PLAN_MODEL, llama2)
     
     Returns:
         JSON response containing the generated skin plan with:
@@ -50,11 +49,8 @@ async def generate_skin_plan(user_id: str, model_name: Optional[str] = "llama2")
             "model_name": model_name
         }
         
-        # Generate the skin plan
-        plan_json = generate_skin_plan_from_json(input_data)
-        
-        # Parse the JSON string to ensure it's valid
-        plan_data = json.loads(plan_json)
+        # Generate the skin plan (already parsed and validated into a dict)
+        plan_data = generate_skin_plan_from_json(input_data)
         
         # Get product recommendations and search for products
         product_recommendations = plan_data.get("product_recommendations", [])
@@ -80,8 +76,6 @@ async def generate_skin_plan(user_id: str, model_name: Optional[str] = "llama2")
             "data": plan_data
         }
         
-    except json.JSONDecodeError as e:
-        raise HTTPException(status_code=500, detail=f"Error parsing generated plan: {str(e)}")
     except HTTPException:
         raise
     except Exception as e:
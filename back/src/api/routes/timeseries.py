@@ -2,7 +2,7 @@ from fastapi import APIRouter, HTTPException
 from typing import List, Dict, Optional
 from datetime import datetime
 from src.api.core.exceptions import DatabaseError
-from src.db.create_db import get_latest_timeseries_data, create_timeseries_table
+from src.db.create_db import get_latest_timeseries_data, create_timeseries_table, encode_products, dump_products, TIMESERIES_COLS
 from src.correlation.analyse_acne_corr import analyze_acne_data
 import sqlite3
 import os
@@ -11,6 +11,10 @@ import uuid
 
 router = APIRouter(prefix="/timeseries", tags=["timeseries"])
 
+# Built once; save_timeseries fills in every column before an entry reaches the insert
+_INSERT_COLS = ("id",) + TIMESERIES_COLS
+_INSERT_SQL = f"INSERT INTO timeseries ({', '.join(_INSERT_COLS)}) VALUES ({', '.join('?' * len(_INSERT_COLS))})"
+
 def save_timeseries_data(entry: Dict) -> bool:
     """
     Save a new timeseries entry to the database.
@@ -35,9 +39,9 @@ def save_timeseries_data(entry: Dict) -> bool:
         conn = sqlite3.connect(db_path, timeout=30)
         cursor = conn.cursor()
         
-        # Add id if not present
+        # Add id if not present (hex: no str() formatting pass over the UUID's dashed form)
         if 'id' not in entry:
-            entry['id'] = str(uuid.uuid4())
+            entry['id'] = uuid.uuid4().hex
             
         # Ensure timestamp is in ISO format
         if 'timestamp' in entry:
@@ -49,13 +53,12 @@ def save_timeseries_data(entry: Dict) -> bool:
                 # If parsing fails, use current time
                 entry['timestamp'] = datetime.now().isoformat()
         
-        # Prepare the SQL query for INSERT (not UPDATE)
-        columns = ', '.join(entry.keys())
-        placeholders = ', '.join(['?' for _ in entry])
-        query = f"INSERT INTO timeseries ({columns}) VALUES ({placeholders})"
+        # Store products as a JSON array and keep the queryable bitmask in sync with it
+        entry['products_mask'] = encode_products(entry.get('products_used'))
+        entry['products_used'] = dump_products(entry.get('products_used'))
         
-        # Execute the query
-        cursor.execute(query, list(entry.values()))
+        # Execute the INSERT (not UPDATE)
+        cursor.execute(_INSERT_SQL, [entry[col] for col in _INSERT_COLS])
         
         # Commit changes
         conn.commit()
@@ -131,7 +134,7 @@ async def save_timeseries(entry: Dict):
             - humidity: float (optional, default 0)
             - pollution: float (optional, default 0)
             - stress: float (optional, default 0)
-            - products_used: str (optional, default '')
+            - products_used: str | List[str] (optional, comma-separated or list, default '')
             - sunlight_exposure: float (optional, default 0)
             
     Returns:
@@ -170,7 +173,7 @@ async def save_timeseries(entry: Dict):
         }
         
         # Add id field
-        entry["id"] = str(uuid.uuid4())
+        entry["id"] = uuid.uuid4().hex
         
         # Update entry with defaults for missing fields
         for key, default_value in defaults.items():
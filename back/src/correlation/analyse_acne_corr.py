@@ -1,20 +1,25 @@
-import sqlite3
 import pandas as pd
 from scipy.stats import pearsonr
 from datetime import datetime, timedelta
 import numpy as np
+from src.db.create_db import get_latest_timeseries_df, dump_products, encode_products, TIMESERIES_COLS
 
 def load_data(db_path: str, user_id: str) -> pd.DataFrame:
     """Load time-series data from SQLite database for a specific user."""
     try:
-        conn = sqlite3.connect(db_path)
-        query = "SELECT * FROM timeseries WHERE user_id = ?"
-        df = pd.read_sql_query(query, conn, parse_dates=['timestamp'], params=[user_id])
-        conn.close()
+        df = get_latest_timeseries_df(user_id, db_path)
         
         if df.empty:
             return pd.DataFrame()  # Return empty DataFrame if no data found
         
+        # Same columns and types as the table itself: the shared query leaves out user_id
+        # and products_mask, and decodes products_used and menstrual_cycle_active
+        df['user_id'] = user_id
+        df['products_mask'] = df['products_used'].map(encode_products)
+        df['products_used'] = df['products_used'].map(dump_products)
+        df['menstrual_cycle_active'] = df['menstrual_cycle_active'].astype(int)
+        df = df[['id', *TIMESERIES_COLS]]
+        
         # Convert numerical columns to float
         numeric_columns = [
             'acne_severity_score', 'diet_sugar', 'diet_dairy', 'diet_alcohol',
@@ -1,49 +1,361 @@
 import sqlite3
 from sqlite3 import Error as SQLiteError
-from datetime import datetime
-import uuid
 import os
-from typing import Optional, Dict, List
+import json
+import time
+import queue
+import atexit
+import threading
+from contextlib import contextmanager
+from typing import Optional, Dict, List, Final
 from pathlib import Path
 
+# Per-connection prepared statement cache size
+CACHED_STATEMENTS = 256
+# Milliseconds a connection waits on a locked database before failing
+BUSY_TIMEOUT_MS = 5000
+# Attempts for multi-statement transactions that still hit SQLITE_BUSY
+BUSY_RETRIES = 3
+# Bytes of the database file read through mmap instead of read() syscalls; this
+# reserves address space (VSZ), while RSS only grows by the pages actually touched
+MMAP_SIZE = 256 * 1024 * 1024
+
+# Passing this as db_path selects a shared-cache in-memory database (e.g. for tests)
+MEMORY_DB = ":memory:"
+MEMORY_DB_URI = "file::memory:?cache=shared"
+# insert_test_data's default target, resolved once at import
+_DEFAULT_TS_DB = str(Path(__file__).resolve().parent / "acne_tracker.db")
+
+# A shared in-memory database only lives while a connection to it stays open
+_memory_keepalive = None
+
+# Columns selected as "name [BOOL]" come back as Python bools, converted as sqlite3 builds the row
+sqlite3.register_converter("BOOL", lambda value: value != b"0")
+
+def _tune(conn):
+    """Switch to WAL journaling and apply per-connection performance PRAGMAs."""
+    # Wait on a locked database (e.g. a WAL checkpoint or another writer) rather than failing at once
+    conn.execute(f"PRAGMA busy_timeout = {BUSY_TIMEOUT_MS}")
+    try:
+        # Persistent once set; fails on read-only mounts, where the default journal is kept
+        conn.execute("PRAGMA journal_mode=WAL")
+    except SQLiteError:
+        pass
+    conn.executescript(
+        "PRAGMA synchronous=NORMAL;"
+        "PRAGMA temp_store=MEMORY;"
+        "PRAGMA cache_size=-20000;"
+        f"PRAGMA mmap_size={MMAP_SIZE};"
+    )
+
+def _open(db_path, check_same_thread=True, readonly=False):
+    """Open a raw connection, mapping MEMORY_DB to the shared in-memory database.
+    
+    readonly opens file databases with mode=ro, so the connection never takes write locks.
+    """
+    global _memory_keepalive
+    if db_path == MEMORY_DB:
+        if _memory_keepalive is None:
+            _memory_keepalive = sqlite3.connect(MEMORY_DB_URI, uri=True, check_same_thread=False)
+        # Nothing to fsync in memory, so the journal PRAGMAs are skipped
+        conn = sqlite3.connect(MEMORY_DB_URI, uri=True, cached_statements=CACHED_STATEMENTS,
+                               check_same_thread=check_same_thread, detect_types=sqlite3.PARSE_COLNAMES)
+        conn.execute(f"PRAGMA busy_timeout = {BUSY_TIMEOUT_MS}")
+        return conn
+    if readonly:
+        conn = sqlite3.connect(f"{Path(db_path).resolve().as_uri()}?mode=ro", uri=True,
+                               cached_statements=CACHED_STATEMENTS, check_same_thread=check_same_thread,
+                               detect_types=sqlite3.PARSE_COLNAMES)
+    else:
+        conn = sqlite3.connect(db_path, cached_statements=CACHED_STATEMENTS, check_same_thread=check_same_thread,
+                               detect_types=sqlite3.PARSE_COLNAMES)
+    _tune(conn)
+    return conn
+
+# Idle connections kept per database path; reusing them preserves each connection's page cache
+POOL_SIZE = 8
+_POOLS: Dict[str, "queue.Queue[sqlite3.Connection]"] = {}
+# Read-only connections for SELECT paths, kept apart so readers never contend with writers
+_RO_POOLS: Dict[str, "queue.Queue[sqlite3.Connection]"] = {}
+_POOLS_LOCK = threading.Lock()
+
+def _drain(pool):
+    """Close every idle connection in pool."""
+    while True:
+        try:
+            conn = pool.get_nowait()
+        except queue.Empty:
+            return
+        conn.close()
+
+def close_pools():
+    """Close every idle pooled connection.
+    
+    Call after replacing or removing a database file in a running process (setup_databases
+    does): a pooled connection keeps reading the file it was opened on.
+    """
+    with _POOLS_LOCK:
+        pools = list(_POOLS.values()) + list(_RO_POOLS.values())
+        _POOLS.clear()
+        _RO_POOLS.clear()
+    for pool in pools:
+        _drain(pool)
+
+@contextmanager
+def get_conn(db_path, readonly=False):
+    """Check out a pooled connection whose block runs as one transaction.
+    
+    The connection goes back to the pool afterwards, or is closed if the pool is full
+    or the block raised. Pass readonly=True for queries that only read.
+    An OperationalError also closes the path's idle connections, which may be as stale
+    (e.g. opened on a file that has since been removed).
+    """
+    pools = _RO_POOLS if readonly else _POOLS
+    with _POOLS_LOCK:
+        pool = pools.setdefault(db_path, queue.Queue(maxsize=POOL_SIZE))
+    try:
+        conn = pool.get_nowait()
+    except queue.Empty:
+        # Pooled connections may be handed to another thread, which the pool serializes
+        conn = _open(db_path, check_same_thread=False, readonly=readonly)
+    try:
+        with conn:
+            yield conn
+    except BaseException as e:
+        conn.close()
+        if isinstance(e, sqlite3.OperationalError):
+            _drain(pool)
+        raise
+    try:
+        pool.put_nowait(conn)
+    except queue.Full:
+        conn.close()
+
+@contextmanager
+def _connect(db_path):
+    """Open a connection whose block runs as one transaction and is always closed."""
+    conn = _open(db_path)
+    try:
+        # Commits on success, rolls back on exception
+        with conn:
+            yield conn
+    finally:
+        conn.close()
+
+# Databases set up in this process; their planner statistics are refreshed on exit
+_OPTIMIZE_PATHS = set()
+
+def _optimize_database(db_path):
+    """Run PRAGMA optimize so the query planner has fresh statistics."""
+    with _connect(db_path) as conn:
+        conn.execute("PRAGMA optimize")
+
+@atexit.register
+def _optimize_on_exit():
+    for db_path in _OPTIMIZE_PATHS:
+        # Never recreate a database that was removed in the meantime
+        if not os.path.exists(db_path):
+            continue
+        try:
+            _optimize_database(db_path)
+        except SQLiteError:
+            pass
+
+# Insertable timeseries columns (everything but the id primary key)
+TIMESERIES_COLS = (
+    "user_id", "timestamp", "acne_severity_score", "diet_sugar", "diet_dairy",
+    "diet_alcohol", "sleep_hours", "sleep_quality", "menstrual_cycle_active",
+    "menstrual_cycle_day", "latitude", "longitude", "humidity", "pollution",
+    "stress", "products_used", "products_mask", "sunlight_exposure"
+)
+INSERT_SQL: Final[str] = f"INSERT INTO timeseries ({', '.join(TIMESERIES_COLS)}) VALUES ({', '.join('?' * len(TIMESERIES_COLS))})"
+
+# All timeseries entries for a user, optionally restricted to a product bit
+_SELECT_TIMESERIES_SQL: Final[str] = """
+SELECT 
+    id, timestamp, acne_severity_score, diet_sugar, diet_dairy, diet_alcohol,
+    sleep_hours, sleep_quality,
+    IFNULL(menstrual_cycle_active, 0) AS "menstrual_cycle_active [BOOL]",
+    menstrual_cycle_day, latitude, longitude, humidity, pollution, stress,
+    IFNULL(products_used, '[]') AS "products_used [JSON]", sunlight_exposure
+FROM timeseries
+WHERE user_id = ? AND (? = 0 OR products_mask & ? != 0)
+ORDER BY timestamp ASC
+"""
+
+# Bit position of each known skincare product in the products_mask column
+PRODUCT_BITS = {
+    "cleanser": 1 << 0,
+    "moisturizer": 1 << 1,
+    "sunscreen": 1 << 2,
+    "serum": 1 << 3,
+    "toner": 1 << 4,
+    "exfoliant": 1 << 5,
+    "retinoid": 1 << 6,
+    "spot treatment": 1 << 7,
+}
+
+# PRAGMA user_version once products_used holds JSON arrays
+_SCHEMA_VERSION = 1
+
+def parse_products(products_used) -> List[str]:
+    """Normalize products given as a list, a JSON array or comma-separated text to a list of names."""
+    if not products_used:
+        return []
+    if isinstance(products_used, str):
+        if products_used.lstrip().startswith("["):
+            products_used = json.loads(products_used)
+        else:
+            products_used = products_used.split(",")
+    return [product.strip() for product in products_used if product and product.strip()]
+
+def _convert_products(value: bytes) -> List[str]:
+    """Decode a products_used value; rows not migrated yet still hold comma-separated text."""
+    try:
+        products_used = json.loads(value)
+    except ValueError:
+        return parse_products(value.decode())
+    return products_used if isinstance(products_used, list) else parse_products(str(products_used))
+
+# Columns selected as "name [JSON]" come back as product lists, converted as sqlite3 builds the row
+sqlite3.register_converter("JSON", _convert_products)
+
+def dump_products(products_used) -> str:
+    """Serialize products in any form accepted by parse_products to the stored JSON array."""
+    return json.dumps(parse_products(products_used))
+
+def encode_products(products_used) -> int:
+    """Encode a product list (see parse_products) into a products_mask bitmask."""
+    mask = 0
+    for product in parse_products(products_used):
+        product = product.lower()
+        for name, bit in PRODUCT_BITS.items():
+            # Match free-text entries such as "CeraVe Cleanser"
+            if name in product:
+                mask |= bit
+    return mask
+
+def _migrate_timeseries_schema(conn):
+    """Bring an existing timeseries table up to the current schema; a no-op once it is."""
+    # Add and backfill products_mask on databases created before it existed
+    columns = [col[1] for col in conn.execute("PRAGMA table_info(timeseries)")]
+    if "products_mask" not in columns:
+        conn.execute("ALTER TABLE timeseries ADD COLUMN products_mask INTEGER NOT NULL DEFAULT 0")
+        rows = conn.execute("SELECT rowid, products_used FROM timeseries").fetchall()
+        conn.executemany(
+            "UPDATE timeseries SET products_mask = ? WHERE rowid = ?",
+            [(encode_products(products_used), rowid) for rowid, products_used in rows]
+        )
+    
+    # Convert comma-joined products_used text from older databases to JSON arrays
+    if conn.execute("PRAGMA user_version").fetchone()[0] < _SCHEMA_VERSION:
+        rows = conn.execute("SELECT rowid, products_used FROM timeseries").fetchall()
+        conn.executemany(
+            "UPDATE timeseries SET products_used = ? WHERE rowid = ?",
+            [(dump_products(products_used), rowid) for rowid, products_used in rows]
+        )
+        conn.execute(f"PRAGMA user_version = {_SCHEMA_VERSION}")
+
+def _create_timeseries_schema(conn):
+    """Create the timeseries table on an open connection."""
+    # Create timeseries table with optional fields
+    create_table_sql = """
+    CREATE TABLE IF NOT EXISTS timeseries (
+        id TEXT PRIMARY KEY,
+        user_id TEXT NOT NULL,
+        timestamp TEXT NOT NULL,
+        acne_severity_score REAL DEFAULT 0,
+        diet_sugar REAL DEFAULT 0,
+        diet_dairy REAL DEFAULT 0,
+        diet_alcohol REAL DEFAULT 0,
+        sleep_hours REAL DEFAULT 0,
+        sleep_quality TEXT DEFAULT 'unknown',
+        menstrual_cycle_active BOOL DEFAULT 0,
+        menstrual_cycle_day INTEGER DEFAULT 0,
+        latitude REAL DEFAULT 0,
+        longitude REAL DEFAULT 0,
+        humidity REAL DEFAULT 0,
+        pollution REAL DEFAULT 0,
+        stress REAL DEFAULT 0,
+        products_used TEXT DEFAULT '[]',
+        products_mask INTEGER NOT NULL DEFAULT 0,
+        sunlight_exposure REAL DEFAULT 0
+    );
+    """
+    conn.execute(create_table_sql)
+    
+    # Serves "WHERE user_id = ? ORDER BY timestamp" as a range scan without a sort
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_ts_user_time ON timeseries(user_id, timestamp)")
+    
+    _migrate_timeseries_schema(conn)
+
+def _create_profiles_schema(conn, db_path, schema="main"):
+    """Create the profiles table on an open connection and insert sample data.
+    
+    schema names the attached database holding the table (see setup_databases).
+    """
+    # Create profiles table
+    create_table_sql = f"""
+    CREATE TABLE IF NOT EXISTS {schema}.profiles (
+        user_id TEXT PRIMARY KEY,
+        name TEXT NOT NULL,
+        dob TEXT NOT NULL,
+        height INTEGER NOT NULL CHECK(height >= 0),
+        weight INTEGER NOT NULL CHECK(weight >= 0),
+        gender TEXT NOT NULL
+    );
+    """
+    
+    # Insert sample data
+    sample_data = [
+        (
+            "user_1",
+            "Amine Maazizi",
+            "2025-05-03",
+            180,
+            90,
+            "Male"
+        )
+    ]
+    
+    # Existing user_ids are skipped by the engine, so re-running setup is a no-op
+    insert_sql = f"""
+    INSERT OR IGNORE INTO {schema}.profiles (
+        user_id, name, dob, height, weight, gender
+    ) VALUES (?, ?, ?, ?, ?, ?)
+    """
+    
+    cursor = conn.cursor()
+    cursor.execute(create_table_sql)
+    cursor.executemany(insert_sql, sample_data)
+    if cursor.rowcount > 0:
+        print(f"Inserted {cursor.rowcount} rows into 'profiles' table in '{db_path}'.")
+
+def _is_access_error(e):
+    """Whether an OperationalError means the database file can't be opened or written."""
+    message = str(e)
+    return "readonly" in message or "unable to open" in message
+
+# (table, db_path) pairs whose schema this process has already created; the DDL is
+# idempotent, so a racing duplicate run is harmless and no lock is needed
+_SCHEMA_READY = set()
+
 def create_timeseries_table(db_path="acne_tracker.db"):
     """Create the timeseries table in the SQLite database."""
+    if ("timeseries", db_path) in _SCHEMA_READY:
+        return
     try:
-        # Check if database file is accessible
-        if os.path.exists(db_path) and not os.access(db_path, os.W_OK):
-            raise PermissionError(f"Cannot write to database file '{db_path}'.")
-        
-        # Connect to SQLite
-        conn = sqlite3.connect(db_path)
-        cursor = conn.cursor()
-        
-        # Create timeseries table with optional fields
-        create_table_sql = """
-        CREATE TABLE IF NOT EXISTS timeseries (
-            id TEXT PRIMARY KEY,
-            user_id TEXT NOT NULL,
-            timestamp TEXT NOT NULL,
-            acne_severity_score REAL DEFAULT 0,
-            diet_sugar REAL DEFAULT 0,
-            diet_dairy REAL DEFAULT 0,
-            diet_alcohol REAL DEFAULT 0,
-            sleep_hours REAL DEFAULT 0,
-            sleep_quality TEXT DEFAULT 'unknown',
-            menstrual_cycle_active INTEGER DEFAULT 0,
-            menstrual_cycle_day INTEGER DEFAULT 0,
-            latitude REAL DEFAULT 0,
-            longitude REAL DEFAULT 0,
-            humidity REAL DEFAULT 0,
-            pollution REAL DEFAULT 0,
-            stress REAL DEFAULT 0,
-            products_used TEXT DEFAULT '',
-            sunlight_exposure REAL DEFAULT 0
-        );
-        """
-        cursor.execute(create_table_sql)
-        conn.commit()
+        with _connect(db_path) as conn:
+            _create_timeseries_schema(conn)
+        _SCHEMA_READY.add(("timeseries", db_path))
         print(f"Created/verified 'timeseries' table in '{db_path}'.")
         
+    except sqlite3.OperationalError as e:
+        if not _is_access_error(e):
+            print(f"SQLite error while creating 'timeseries' table: {e}")
+            raise
+        print(f"Permission error while creating 'timeseries' table: {e}")
+        raise PermissionError(f"Cannot write to database file '{db_path}': {e}") from e
     except SQLiteError as e:
         print(f"SQLite error while creating 'timeseries' table: {e}")
         raise
@@ -53,77 +365,80 @@ def create_timeseries_table(db_path="acne_tracker.db"):
     except Exception as e:
         print(f"Unexpected error while creating 'timeseries' table: {e}")
         raise
-    finally:
-        if 'conn' in locals():
-            conn.close()
+
+def _read_timeseries(db_path, read):
+    """Return read(conn) on a pooled read-only connection.
+    
+    setup_databases and create_timeseries_table migrate the table up front. A table
+    they haven't seen, created before products_mask existed, fails the query with
+    "no such column"; it is then migrated once and read again.
+    """
+    try:
+        with get_conn(db_path, readonly=True) as conn:
+            return read(conn)
+    except Exception as e:
+        # pandas wraps the OperationalError in its own DatabaseError
+        if "no such column" not in str(e):
+            raise
+    with _connect(db_path) as conn:
+        _migrate_timeseries_schema(conn)
+    with get_conn(db_path, readonly=True) as conn:
+        return read(conn)
 
 def create_profiles_table(db_path="user_profiles.db"):
     """Create the profiles table in the SQLite database."""
+    if ("profiles", db_path) in _SCHEMA_READY:
+        return
     try:
-        # Check if database file is accessible
-        if os.path.exists(db_path) and not os.access(db_path, os.W_OK):
-            raise PermissionError(f"Cannot write to database file '{db_path}'.")
-        
-        # Connect to SQLite
-        conn = sqlite3.connect(db_path)
-        cursor = conn.cursor()
-        
-        # Create profiles table
-        create_table_sql = """
-        CREATE TABLE IF NOT EXISTS profiles (
-            user_id TEXT PRIMARY KEY,
-            name TEXT NOT NULL,
-            dob TEXT NOT NULL,
-            height INTEGER NOT NULL CHECK(height >= 0),
-            weight INTEGER NOT NULL CHECK(weight >= 0),
-            gender TEXT NOT NULL
-        );
-        """
-        cursor.execute(create_table_sql)
-        
-        # Insert sample data
-        sample_data = [
-            (
-                "user_1",
-                "Amine Maazizi",
-                "2025-05-03",
-                180,
-                90,
-                "Male"
-            )
-        ]
-        
-        insert_sql = """
-        INSERT INTO profiles (
-            user_id, name, dob, height, weight, gender
-        ) VALUES (?, ?, ?, ?, ?, ?)
-        """
-        
-        try:
-            cursor.executemany(insert_sql, sample_data)
-            conn.commit()
-            print(f"Inserted {len(sample_data)} rows into 'profiles' table in '{db_path}'.")
-        except sqlite3.IntegrityError as e:
-            print(f"Warning: Integrity error while inserting sample data into 'profiles': {e}")
+        with _connect(db_path) as conn:
+            _create_profiles_schema(conn, db_path)
+        _SCHEMA_READY.add(("profiles", db_path))
         
+    except sqlite3.OperationalError as e:
+        if _is_access_error(e):
+            raise PermissionError(f"Cannot write to database file '{db_path}': {e}") from e
+        raise SQLiteError(f"Failed to create or modify 'profiles' table in '{db_path}': {e}")
     except SQLiteError as e:
         raise SQLiteError(f"Failed to create or modify 'profiles' table in '{db_path}': {e}")
     except PermissionError as e:
         raise PermissionError(e)
     except Exception as e:
         raise RuntimeError(f"Unexpected error while setting up 'profiles' table: {e}")
-    finally:
-        if 'conn' in locals():
-            conn.close()
 
-def setup_databases(timeseries_db_path="acne_tracker.db", profiles_db_path="user_profiles.db"):
-    """Set up both timeseries and profiles SQLite databases."""
+def setup_databases(timeseries_db_path="acne_tracker.db", profiles_db_path="user_profiles.db", use_memory=False):
+    """Set up both timeseries and profiles SQLite databases.
+    
+    With use_memory=True both tables are created in the shared in-memory database.
+    """
+    if use_memory:
+        timeseries_db_path = profiles_db_path = MEMORY_DB
+    
+    # Don't hand out connections opened on files this setup may be replacing
+    close_pools()
+    
     try:
-        # Create timeseries table
-        create_timeseries_table(timeseries_db_path)
+        if os.path.abspath(timeseries_db_path) == os.path.abspath(profiles_db_path):
+            # Same file: create both tables in one connection and transaction
+            with _connect(timeseries_db_path) as conn:
+                _create_timeseries_schema(conn)
+                _create_profiles_schema(conn, profiles_db_path)
+        else:
+            # Different files: attach the profiles database to a single connection so both
+            # schemas are created without a second open/PRAGMA handshake
+            with _connect(timeseries_db_path) as conn:
+                # Detached implicitly when _connect closes the connection
+                conn.execute("ATTACH DATABASE ? AS profiles_db", (profiles_db_path,))
+                try:
+                    conn.execute("PRAGMA profiles_db.journal_mode=WAL")
+                except SQLiteError:
+                    pass
+                _create_timeseries_schema(conn)
+                _create_profiles_schema(conn, profiles_db_path, schema="profiles_db")
+        _SCHEMA_READY.update({("timeseries", timeseries_db_path), ("profiles", profiles_db_path)})
         
-        # Create profiles table
-        create_profiles_table(profiles_db_path)
+        # Gather planner statistics for the timeseries queries
+        _optimize_database(timeseries_db_path)
+        _OPTIMIZE_PATHS.add(timeseries_db_path)
         
         print("SQLite database setup completed successfully.")
         
@@ -134,66 +449,43 @@ def setup_databases(timeseries_db_path="acne_tracker.db", profiles_db_path="user
     except Exception as e:
         raise RuntimeError(f"Unexpected error during database setup: {e}")
 
-def get_latest_timeseries_data(user_id: str, db_path: str = "acne_tracker.db") -> List[Dict]:
+def _product_bit(product: Optional[str]) -> int:
+    """Resolve a product filter to its PRODUCT_BITS bit, 0 meaning no filter."""
+    product_bit = PRODUCT_BITS.get(product.lower(), 0) if product else 0
+    if product and not product_bit:
+        raise ValueError(f"Unknown product '{product}'")
+    return product_bit
+
+def get_latest_timeseries_data(user_id: str, db_path: str = "acne_tracker.db", product: Optional[str] = None) -> List[Dict]:
     """
     Get all timeseries data for a given user.
     
     Args:
         user_id: The ID of the user to fetch data for
         db_path: Path to the SQLite database file
+        product: Optional product name (see PRODUCT_BITS) the entries must include
         
     Returns:
         List of dictionaries containing all timeseries data for the user
     """
+    product_bit = _product_bit(product)
+    
     try:
         # Check if database file exists
-        if not os.path.exists(db_path):
+        if db_path != MEMORY_DB and not os.path.exists(db_path):
             raise FileNotFoundError(f"Database file '{db_path}' not found")
         
-        # Connect to SQLite
-        conn = sqlite3.connect(db_path)
-        cursor = conn.cursor()
-        
-        # Get all timeseries entries for the user
-        query = """
-        SELECT 
-            id, timestamp, acne_severity_score, diet_sugar, diet_dairy, diet_alcohol,
-            sleep_hours, sleep_quality, menstrual_cycle_active, menstrual_cycle_day,
-            latitude, longitude, humidity, pollution, stress, products_used, sunlight_exposure
-        FROM timeseries
-        WHERE user_id = ?
-        ORDER BY timestamp ASC
-        """
-        
-        cursor.execute(query, (user_id,))
-        rows = cursor.fetchall()
-        
-        if not rows:
-            return []
+        def read(conn):
+            cursor = conn.cursor()
+            # Set per cursor so pooled connections keep plain tuple rows for other callers
+            cursor.row_factory = sqlite3.Row
+            cursor.execute(_SELECT_TIMESERIES_SQL, (user_id, product_bit, product_bit))
             
-        # Convert rows to list of dictionaries
-        timeseries_data = []
-        for row in rows:
-            entry = {
-                "id": row[0],
-                "timestamp": row[1],
-                "acne_severity_score": row[2],
-                "diet_sugar": row[3],
-                "diet_dairy": row[4],
-                "diet_alcohol": row[5],
-                "sleep_hours": row[6],
-                "sleep_quality": row[7],
-                "menstrual_cycle_active": bool(row[8]),
-                "menstrual_cycle_day": row[9],
-                "latitude": row[10],
-                "longitude": row[11],
-                "humidity": row[12],
-                "pollution": row[13],
-                "stress": row[14],
-                "products_used": row[15],
-                "sunlight_exposure": row[16]
-            }
-            timeseries_data.append(entry)
+            # Step through the cursor rather than buffering every row with fetchall()
+            return [dict(row) for row in cursor]
+        
+        # Reuse a pooled read-only connection instead of reopening the database
+        timeseries_data = _read_timeseries(db_path, read)
         
         return timeseries_data
         
@@ -201,22 +493,53 @@ def get_latest_timeseries_data(user_id: str, db_path: str = "acne_tracker.db") -
         raise SQLiteError(f"Failed to fetch timeseries data: {e}")
     except Exception as e:
         raise RuntimeError(f"Unexpected error while fetching timeseries data: {e}")
-    finally:
-        if 'conn' in locals():
-            conn.close()
 
-def insert_test_data():
-    """Insert test data for the test user."""
+def get_latest_timeseries_df(user_id: str, db_path: str = "acne_tracker.db", product: Optional[str] = None):
+    """
+    Get all timeseries data for a given user as a pandas DataFrame.
+    
+    Same rows as get_latest_timeseries_data, but read column-wise by pandas with
+    timestamp parsed to datetimes, for the analysis code that works on columns.
+    
+    Args:
+        user_id: The ID of the user to fetch data for
+        db_path: Path to the SQLite database file
+        product: Optional product name (see PRODUCT_BITS) the entries must include
+        
+    Returns:
+        pandas.DataFrame with one row per timeseries entry, oldest first
+    """
+    # Imported here so the database module doesn't require pandas
+    import pandas as pd
+    
+    product_bit = _product_bit(product)
+    
     try:
-        db_dir = Path(__file__).parent
-        db_path = str(db_dir / "acne_tracker.db")
+        if db_path != MEMORY_DB and not os.path.exists(db_path):
+            raise FileNotFoundError(f"Database file '{db_path}' not found")
         
+        return _read_timeseries(db_path, lambda conn: pd.read_sql_query(
+            _SELECT_TIMESERIES_SQL, conn,
+            params=(user_id, product_bit, product_bit),
+            parse_dates=["timestamp"]
+        ))
+        
+    except SQLiteError as e:
+        raise SQLiteError(f"Failed to fetch timeseries data: {e}")
+    except Exception as e:
+        raise RuntimeError(f"Unexpected error while fetching timeseries data: {e}")
+
+def insert_test_data(db_path: str = _DEFAULT_TS_DB):
+    """Insert test data for the test user.
+    
+    Args:
+        db_path: Target database; defaults to acne_tracker.db next to this module.
+            Pass MEMORY_DB to write to the shared in-memory database instead.
+    """
+    try:
         # Ensure database and table exist
         create_timeseries_table(db_path)
         
-        conn = sqlite3.connect(db_path)
-        cursor = conn.cursor()
-        
         # Test data for test_user_1
         test_data = [
             {
@@ -235,7 +558,7 @@ def insert_test_data():
                 "humidity": 60.0,
                 "pollution": 30.0,
                 "stress": 5.0,
-                "products_used": "cleanser,moisturizer",
+                "products_used": ["cleanser", "moisturizer"],
                 "sunlight_exposure": 2.0
             },
             {
@@ -254,7 +577,7 @@ def insert_test_data():
                 "humidity": 55.0,
                 "pollution": 25.0,
                 "stress": 4.0,
-                "products_used": "cleanser,moisturizer,sunscreen",
+                "products_used": ["cleanser", "moisturizer", "sunscreen"],
                 "sunlight_exposure": 1.5
             },
             {
@@ -273,20 +596,28 @@ def insert_test_data():
                 "humidity": 50.0,
                 "pollution": 20.0,
                 "stress": 3.0,
-                "products_used": "cleanser,moisturizer,sunscreen,serum",
+                "products_used": ["cleanser", "moisturizer", "sunscreen", "serum"],
                 "sunlight_exposure": 1.0
             }
         ]
         
-        # Insert test data
         for entry in test_data:
-            columns = ', '.join(entry.keys())
-            placeholders = ', '.join(['?' for _ in entry])
-            query = f"INSERT INTO timeseries ({columns}) VALUES ({placeholders})"
-            cursor.execute(query, list(entry.values()))
+            entry["products_mask"] = encode_products(entry["products_used"])
+            entry["products_used"] = json.dumps(entry["products_used"])
+        
+        rows = [tuple(entry[col] for col in TIMESERIES_COLS) for entry in test_data]
+        
+        # Insert test data in a single transaction, retrying if the database stays locked
+        for attempt in range(1, BUSY_RETRIES + 1):
+            try:
+                with _connect(db_path) as conn:
+                    conn.executemany(INSERT_SQL, rows)
+                break
+            except sqlite3.OperationalError as e:
+                if "locked" not in str(e) or attempt == BUSY_RETRIES:
+                    raise
+                time.sleep(0.1 * attempt)
         
-        conn.commit()
-        conn.close()
         print("Test data inserted successfully")
     except Exception as e:
         print(f"Error inserting test data: {e}")
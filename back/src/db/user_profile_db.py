@@ -1,13 +1,31 @@
+import re
 import sqlite3
-from typing import Optional, Dict, Union
+from typing import Optional, Dict, Union, Final, Iterable, Tuple, Set
 import os
 from datetime import datetime
+from .create_db import get_conn, _connect, _open
 
 ## ALL TESTS PASSED
 
 BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
 DB_PATH = os.path.join(BASE_DIR, "tsa", "acne_tracker.db")
 
+# Statements are kept as module constants so sqlite3's statement cache hits on every call
+_UPSERT_PROFILE_SQL: Final[str] = '''
+    INSERT INTO user_profiles (user_id, name, dob, height, weight, gender)
+    VALUES (?, ?, ?, ?, ?, ?)
+    ON CONFLICT(user_id) DO UPDATE SET
+        name=excluded.name,
+        dob=excluded.dob,
+        height=excluded.height,
+        weight=excluded.weight,
+        gender=excluded.gender
+'''
+_SELECT_PROFILE_SQL: Final[str] = "SELECT user_id, name, dob, height, weight, gender FROM user_profiles WHERE user_id = ?"
+
+# YYYY-MM-DD, matched in full
+_DOB_RE = re.compile(r"([0-9]{4})-([0-9]{2})-([0-9]{2})")
+
 class ValidationError(Exception):
     """Custom exception for validation errors"""
     pass
@@ -26,8 +44,12 @@ def validate_profile_data(user_id: str, name: str, dob: str, height: Union[float
     # Validate dob
     if not isinstance(dob, str) or not dob:
         raise ValidationError("dob must be a non-empty string")
+    match = _DOB_RE.fullmatch(dob)
+    if not match:
+        raise ValidationError("dob must be in YYYY-MM-DD format")
     try:
-        datetime.strptime(dob, "%Y-%m-%d")
+        # The constructor range-checks month/day (leap years included) without format parsing
+        datetime(*map(int, match.groups()))
     except ValueError:
         raise ValidationError("dob must be in YYYY-MM-DD format")
     
@@ -54,56 +76,50 @@ def validate_profile_data(user_id: str, name: str, dob: str, height: Union[float
         raise ValidationError("gender must be a string")
 
 def get_db_connection(db_path: str = DB_PATH) -> sqlite3.Connection:
-    """Get a database connection with the specified path"""
-    return sqlite3.connect(db_path)
+    """Get a database connection with the specified path, tuned like every create_db connection"""
+    return _open(db_path)
+
+# Paths whose user_profiles table this process has already created
+_SCHEMA_READY: Set[str] = set()
 
 def init_db(db_path: str = DB_PATH):
     """Initialize the database with the user_profiles table"""
-    conn = get_db_connection(db_path)
-    cursor = conn.cursor()
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS user_profiles (
-            user_id TEXT PRIMARY KEY,
-            name TEXT NOT NULL,
-            dob TEXT NOT NULL,
-            height REAL,
-            weight REAL,
-            gender TEXT
-        )
-    ''')
-    conn.commit()
-    conn.close()
+    if db_path in _SCHEMA_READY:
+        return
+    with _connect(db_path) as conn:
+        conn.execute('''
+            CREATE TABLE IF NOT EXISTS user_profiles (
+                user_id TEXT PRIMARY KEY,
+                name TEXT NOT NULL,
+                dob TEXT NOT NULL,
+                height REAL,
+                weight REAL,
+                gender TEXT
+            )
+        ''')
+    _SCHEMA_READY.add(db_path)
+
+def save_profiles_to_db(profiles: Iterable[Tuple], db_path: str = DB_PATH):
+    """Save or update many (user_id, name, dob, height, weight, gender) profiles in one transaction"""
+    # Validate everything first so a bad row leaves the database untouched
+    rows = [tuple(profile) for profile in profiles]
+    for row in rows:
+        validate_profile_data(*row)
+    
+    with get_conn(db_path) as conn:
+        conn.executemany(_UPSERT_PROFILE_SQL, rows)
 
 def save_profile_to_db(user_id: str, name: str, dob: str, height: float, weight: float, gender: str, db_path: str = DB_PATH):
     """Save or update a user profile in the database"""
-    # Validate data before saving
-    validate_profile_data(user_id, name, dob, height, weight, gender)
-    
-    conn = get_db_connection(db_path)
-    cursor = conn.cursor()
-    cursor.execute('''
-        INSERT INTO user_profiles (user_id, name, dob, height, weight, gender)
-        VALUES (?, ?, ?, ?, ?, ?)
-        ON CONFLICT(user_id) DO UPDATE SET
-            name=excluded.name,
-            dob=excluded.dob,
-            height=excluded.height,
-            weight=excluded.weight,
-            gender=excluded.gender
-    ''', (user_id, name, dob, height, weight, gender))
-    conn.commit()
-    conn.close()
+    save_profiles_to_db([(user_id, name, dob, height, weight, gender)], db_path=db_path)
 
 def get_profile_from_db(user_id: str, db_path: str = DB_PATH) -> Optional[Dict]:
     """Retrieve a user profile from the database"""
     if not isinstance(user_id, str) or not user_id:
         raise ValidationError("user_id must be a non-empty string")
         
-    conn = get_db_connection(db_path)
-    cursor = conn.cursor()
-    cursor.execute("SELECT user_id, name, dob, height, weight, gender FROM user_profiles WHERE user_id = ?", (user_id,))
-    row = cursor.fetchone()
-    conn.close()
+    with get_conn(db_path, readonly=True) as conn:
+        row = conn.execute(_SELECT_PROFILE_SQL, (user_id,)).fetchone()
     if row:
         return {
             "user_id": row[0],
@@ -5,8 +5,15 @@ import numpy as np
 import matplotlib.pyplot as plt 
 import math 
 import traceback
-from scipy.ndimage import gaussian_filter
+import multiprocessing
+import threading
+from functools import lru_cache
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
 from ultralytics import YOLO
+try:
+    from numba import njit # Optional: compiles the score accumulator
+except ImportError:
+    njit = None
 import base64 
 
 # --- Default Configuration Constants ---
@@ -26,77 +33,236 @@ DEFAULT_GAUSSIAN_SPREAD_SIGMA = 90
 DEFAULT_SECONDARY_BLUR_KERNEL_SIZE = 0
 DEFAULT_SCORE_RANGE = (0, 100) # AcneAI score range
 DEFAULT_CONFIDENCE_THRESHOLD = 0.25
+PSF_STAMP_MAX_POINTS = 50 # Above this many points, one full-image blur beats stamping a PSF per point
+HEATMAP_BLEND_THRESHOLD = 8 # Normalized heat at or below this leaves the original pixels untouched
+HEATMAP_GRID_SIGMA = 16 # The spread is computed on a grid downsampled by spread_sigma // this, then upsampled
+DEFAULT_ENGINE_IMGSZ = 640 # Input size the TensorRT engine is built for
+DEFAULT_PREDICT_BATCH = 8 # Max images per forward pass (and TensorRT engine batch size)
+
+# Loaded models by path, so each process reads the weights (and builds any engine) once
+_MODEL_CACHE = {}
+# Severity lookup tables by (model_path, severity_map items, default severity)
+_SEVERITY_LUT_CACHE = {}
+# On GPU, run FP16 inference (Tensor Cores) on the first device; per-image console logging is off either way
+_PREDICT_KWARGS = {'half': True, 'device': 0, 'verbose': False} if torch.cuda.is_available() else {'verbose': False}
+# On GPU, inputs are letterboxed to a fixed size, so cuDNN can autotune its conv algorithms once and reuse them
+if torch.cuda.is_available(): torch.backends.cudnn.benchmark = True
+# Pinned host buffer (one per thread, created on first use) the GPU input batches are stacked into,
+# so their upload is asynchronous
+_PINNED_INPUT = threading.local()
+# Decodes input images in parallel and, with encode_overlay, encodes heatmap overlays in the background
+# while the next image is predicted (cv2.imread / cv2.imencode release the GIL)
+_IO_POOL = ThreadPoolExecutor(max_workers=min(8, os.cpu_count() or 2))
 
 # --- Helper Function Definitions ---
 
-def generate_spread_heatmap(image, detection_results, severity_map, default_s_i,
+@lru_cache(maxsize=8)
+def _gaussian_kernel(sigma):
+    """1D Gaussian kernel truncated at 4 sigma (as scipy's gaussian_filter) and its radius."""
+    radius = int(4.0 * sigma + 0.5)
+    return cv2.getGaussianKernel(2 * radius + 1, sigma, cv2.CV_32F).ravel(), radius
+
+
+def _reflected_profile(center, length, kernel, radius):
+    """
+    1D PSF of a delta at center over [0, length), folded back at both edges like a
+    reflect-border blur. Returns (start, stop, values) for the non-zero window.
+    """
+    start = max(0, min(center, -1 - center, 2 * length - 1 - center) - radius)
+    stop = min(length, max(center, -1 - center, 2 * length - 1 - center) + radius + 1)
+    profile = np.zeros(stop - start, dtype=np.float32)
+    for c in (center, -1 - center, 2 * length - 1 - center):
+        lo = max(start, c - radius); hi = min(stop, c + radius + 1)
+        if lo < hi: profile[lo - start:hi - start] += kernel[lo - c + radius:hi - c + radius]
+    return start, stop, profile
+
+
+def _spread_points(ys, xs, weights, img_h, img_w, sigma):
+    """
+    Gaussian-spreads weighted points (row, column and weight arrays) over an img_h x img_w map, matching
+    gaussian_filter(mode='reflect'). Few points are stamped as separable PSF tiles;
+    many points are deposited and blurred once with cv2.GaussianBlur.
+    A wide spread is smooth, so it is computed on a grid downsampled by
+    sigma // HEATMAP_GRID_SIGMA (with the sigma scaled to match).
+    Returns (grid, scale); resize the grid to (img_w, img_h) when scale > 1.
+    """
+    scale = max(1, int(sigma // HEATMAP_GRID_SIGMA))
+    grid_h = -(-img_h // scale); grid_w = -(-img_w // scale)
+    kernel, radius = _gaussian_kernel(sigma / scale)
+    heatmap = np.zeros((grid_h, grid_w), dtype=np.float32)
+    if len(weights) > PSF_STAMP_MAX_POINTS:
+        np.add.at(heatmap, (ys // scale, xs // scale), weights.astype(np.float32))
+        ksize = 2 * radius + 1
+        heatmap = cv2.GaussianBlur(heatmap, (ksize, ksize), sigma / scale, borderType=cv2.BORDER_REFLECT)
+    else:
+        for y, x, weight in zip(ys, xs, weights):
+            y0, y1, py = _reflected_profile(y // scale, grid_h, kernel, radius)
+            x0, x1, px = _reflected_profile(x // scale, grid_w, kernel, radius)
+            heatmap[y0:y1, x0:x1] += np.float32(weight) * np.outer(py, px)
+    return heatmap, scale
+
+
+@lru_cache(maxsize=4)
+def _colormap_lut(colormap):
+    """The (256, 1, 3) BGR table of an OpenCV colormap, which cv2.applyColorMap takes directly."""
+    return cv2.applyColorMap(np.arange(256, dtype=np.uint8).reshape(256, 1), colormap).reshape(256, 1, 3)
+
+
+def _normalize_u8(heatmap):
+    """Min-max scales a float map to uint8 0..255 (all zeros when the map is empty)."""
+    # One scan for min/max plus one fused scale-and-cast pass
+    min_val, max_val, _, _ = cv2.minMaxLoc(heatmap)
+    if max_val <= 1e-6: return np.zeros(heatmap.shape, dtype=np.uint8)
+    scale = 255.0 / (max_val - min_val) if max_val > min_val else 0.0
+    return cv2.convertScaleAbs(heatmap, alpha=scale, beta=-min_val * scale)
+
+
+def _extract_detections(detection_results, letterbox=None):
+    """
+    Copies the first YOLO result's boxes to host memory once, as structure-of-arrays:
+    'xyxy' (N, 4) float32, 'cls' (N,) int32, 'conf' (N,) float32 and the 'names' map.
+    letterbox (optional) is (ratio, (pad_x, pad_y), (h, w)) from _letterbox; boxes are mapped
+    back from the letterboxed input to the original h x w image.
+    Empty or unreadable results give N = 0.
+    """
+    detections = {'xyxy': np.zeros((0, 4), dtype=np.float32), 'cls': np.zeros(0, dtype=np.int32),
+                  'conf': np.zeros(0, dtype=np.float32), 'names': {}}
+    if not detection_results or len(detection_results) == 0: return detections
+    try:
+        result = detection_results[0]; boxes = result.boxes; names = getattr(result, 'names', {})
+        detections['names'] = names if isinstance(names, dict) else {}
+        if boxes is None or len(boxes) == 0: return detections
+        # boxes.data rows are [x1, y1, x2, y2, (track_id,) conf, cls]: one device->host copy
+        # (and sync) for all three arrays instead of one per tensor
+        data = boxes.data.detach().cpu().numpy().astype(np.float32, copy=False)
+        detections['xyxy'] = data[:, :4]
+        if letterbox is not None:
+            ratio, (pad_x, pad_y), (img_h, img_w) = letterbox
+            xyxy = (data[:, :4] - np.array([pad_x, pad_y, pad_x, pad_y], dtype=np.float32)) / np.float32(ratio)
+            np.clip(xyxy[:, 0::2], 0, img_w, out=xyxy[:, 0::2]); np.clip(xyxy[:, 1::2], 0, img_h, out=xyxy[:, 1::2])
+            detections['xyxy'] = xyxy
+        detections['conf'] = data[:, -2]
+        detections['cls'] = data[:, -1].astype(np.int32)
+    except (AttributeError, IndexError, TypeError) as e: pass
+    return detections
+
+
+def _severity_lut(names, severity_map, default_s_i, max_class_id=-1):
+    """s_i for every class id up to max(names, max_class_id), so per-box severities are one gather."""
+    lut_size = max(max(names, default=-1), max_class_id) + 1
+    return np.array([severity_map.get(names.get(i, f"class_{i}"), default_s_i) for i in range(lut_size)], dtype=np.float64)
+
+
+def _class_severities(detections, severity_map, default_s_i, severity_lut=None):
+    """Per-box s_i, gathered from severity_lut when it covers every class id (else a fresh table)."""
+    cls_ids = detections['cls']; max_class_id = int(cls_ids.max())
+    if severity_lut is None or max_class_id >= len(severity_lut):
+        severity_lut = _severity_lut(detections['names'], severity_map, default_s_i, max_class_id)
+    # Ids are in range by now, so 'clip' only skips numpy's bounds-check/raise path
+    return severity_lut, np.take(severity_lut, cls_ids, mode='clip')
+
+
+def _model_severity_lut(model_path, names, severity_map, default_s_i):
+    """Severity lookup table for a loaded model's classes, built once per model and severity map."""
+    key = (model_path, frozenset(severity_map.items()), default_s_i)
+    severity_lut = _SEVERITY_LUT_CACHE.get(key)
+    if severity_lut is None: severity_lut = _SEVERITY_LUT_CACHE[key] = _severity_lut(names, severity_map, default_s_i)
+    return severity_lut
+
+
+def _generate_spread_heatmap(image, detections, severity_map, default_s_i,
                             weighting=DEFAULT_HEATMAP_WEIGHTING, alpha=DEFAULT_HEATMAP_ALPHA,
                             spread_sigma=DEFAULT_GAUSSIAN_SPREAD_SIGMA,
                             secondary_blur_ksize=DEFAULT_SECONDARY_BLUR_KERNEL_SIZE,
-                            colormap=DEFAULT_COLORMAP):
-    """Generates a heatmap overlay. (Function body remains the same)"""
+                            colormap=DEFAULT_COLORMAP, severity_lut=None, severities=None):
+    """
+    Generates a heatmap overlay from _extract_detections output.
+    image must be a contiguous uint8 BGR array, as cv2.imread returns.
+    severity_lut (optional) is a precomputed class-id -> s_i table (see _model_severity_lut);
+    severities (optional) are the per-box s_i already gathered from it.
+    """
     if not isinstance(image, np.ndarray) or image.ndim != 3: return image, np.zeros(image.shape[:2] if isinstance(image, np.ndarray) else (100, 100), dtype=np.float32)
-    if not detection_results or len(detection_results) == 0: return image, np.zeros(image.shape[:2], dtype=np.float32)
-    try:
-        result = detection_results[0]; boxes = result.boxes; names = getattr(result, 'names', {});
-        if not isinstance(names, dict): names = {}
-        img_h, img_w = image.shape[:2]
-    except (AttributeError, IndexError) as e: return image, np.zeros(image.shape[:2], dtype=np.float32)
-    heatmap_raw = np.zeros((img_h, img_w), dtype=np.float32); num_detections = len(boxes) if boxes is not None else 0
-    if num_detections > 0:
-        points_data = []
-        for box in boxes:
-             try:
-                x1, y1, x2, y2 = box.xyxy[0].cpu().numpy(); cx = max(0, min(img_w - 1, int((x1 + x2) / 2))); cy = max(0, min(img_h - 1, int((y1 + y2) / 2)))
-                point_weight = 1.0
-                if weighting == 'severity':
-                    class_id = int(box.cls[0]); class_name = names.get(class_id, f"class_{class_id}"); s_i = severity_map.get(class_name, default_s_i); point_weight = float(s_i)
-                elif weighting == 'confidence': point_weight = float(box.conf[0])
-                if point_weight > 0: points_data.append((cy, cx, point_weight))
-             except (AttributeError, IndexError, TypeError) as e: continue
-        if points_data:
-            for y, x, weight in points_data: heatmap_raw[y, x] += weight
-            if spread_sigma > 0: heatmap_spread = gaussian_filter(heatmap_raw, sigma=spread_sigma)
-            else: heatmap_spread = heatmap_raw
-            if secondary_blur_ksize and secondary_blur_ksize > 1 and secondary_blur_ksize % 2 == 1: heatmap_blurred = cv2.GaussianBlur(heatmap_spread, (secondary_blur_ksize, secondary_blur_ksize), 0)
-            else: heatmap_blurred = heatmap_spread
-            max_val = np.max(heatmap_blurred)
-            if max_val > 1e-6: heatmap_norm = cv2.normalize(heatmap_blurred, None, 0, 255, cv2.NORM_MINMAX, dtype=cv2.CV_8U)
-            else: heatmap_norm = np.zeros(heatmap_blurred.shape, dtype=cv2.CV_8U)
-            heatmap_color = cv2.applyColorMap(heatmap_norm, colormap)
-            image_uint8 = image.astype(np.uint8) if image.dtype != np.uint8 else image
-            heatmap_overlay = cv2.addWeighted(heatmap_color, alpha, image_uint8, 1 - alpha, 0)
-            return heatmap_overlay, heatmap_norm
-        else: return image, heatmap_raw
-    else: return image, heatmap_raw
+    assert image.dtype == np.uint8 and image.flags['C_CONTIGUOUS'], "_generate_spread_heatmap expects a contiguous uint8 image"
+    img_h, img_w = image.shape[:2]
+    heatmap_raw = np.zeros((img_h, img_w), dtype=np.float32)
+    if not detections or len(detections['cls']) == 0: return image, heatmap_raw
+    xyxy = detections['xyxy']; cls_ids = detections['cls']
+    # Box centers, truncated like int() and clamped into the image
+    cx = np.clip(((xyxy[:, 0] + xyxy[:, 2]) / 2).astype(np.int64), 0, img_w - 1)
+    cy = np.clip(((xyxy[:, 1] + xyxy[:, 3]) / 2).astype(np.int64), 0, img_h - 1)
+    if weighting == 'severity': weights = severities if severities is not None else _class_severities(detections, severity_map, default_s_i, severity_lut)[1]
+    elif weighting == 'confidence': weights = detections['conf'].astype(np.float64)
+    else: weights = np.ones(len(cls_ids), dtype=np.float64)
+    keep = weights > 0
+    if not np.any(keep): return image, heatmap_raw
+    ys, xs, weights = cy[keep], cx[keep], weights[keep]
+    if spread_sigma > 0: heatmap_spread, grid_scale = _spread_points(ys, xs, weights, img_h, img_w, spread_sigma)
+    else:
+        np.add.at(heatmap_raw, (ys, xs), weights.astype(np.float32))
+        heatmap_spread = heatmap_raw; grid_scale = 1
+    secondary_blur = secondary_blur_ksize and secondary_blur_ksize > 1 and secondary_blur_ksize % 2 == 1
+    if grid_scale > 1 and not secondary_blur:
+        # Quantize on the small grid, so the full-resolution upsample moves uint8 rather than float32
+        heatmap_norm = cv2.resize(_normalize_u8(heatmap_spread), (img_w, img_h), interpolation=cv2.INTER_LINEAR)
+    else:
+        if grid_scale > 1: heatmap_spread = cv2.resize(heatmap_spread, (img_w, img_h), interpolation=cv2.INTER_LINEAR)
+        if secondary_blur: heatmap_blurred = cv2.GaussianBlur(heatmap_spread, (secondary_blur_ksize, secondary_blur_ksize), 0)
+        else: heatmap_blurred = heatmap_spread
+        heatmap_norm = _normalize_u8(heatmap_blurred)
+    # Colormap and blend only inside the bounding box of the active heat, then keep
+    # original pixels wherever the heat is below the threshold
+    active = (heatmap_norm > HEATMAP_BLEND_THRESHOLD).view(np.uint8)
+    heatmap_overlay = image.copy()
+    x, y, w, h = cv2.boundingRect(active)
+    if w > 0 and h > 0:
+        roi = (slice(y, y + h), slice(x, x + w))
+        # A cached table: a built-in colormap id rebuilds its table on every call
+        heatmap_color = cv2.applyColorMap(heatmap_norm[roi], _colormap_lut(colormap))
+        # Blended in place into the colormap buffer, and masked through a bool view: no further ROI-sized allocations
+        cv2.addWeighted(heatmap_color, alpha, image[roi], 1 - alpha, 0, dst=heatmap_color)
+        np.copyto(heatmap_overlay[roi], heatmap_color, where=active[roi].view(bool)[..., None])
+    return heatmap_overlay, heatmap_norm
 
 
-def calculate_acneai_score(detection_results, image_shape, severity_map, default_s_i):
+def _acneai_accumulate_loop(xyxy, severities, A):
+    """One pass over the boxes and their s_i. Returns (sum_term, total_lesion_area, sum_severity_points, N)."""
+    sum_term = 0.0; total_area = 0.0; sum_severity = 0.0; n_valid = 0
+    for i in range(xyxy.shape[0]):
+        w = xyxy[i, 2] - xyxy[i, 0]; h = xyxy[i, 3] - xyxy[i, 1]
+        if w <= 0 or h <= 0: continue
+        a_i = w * h; s_i = severities[i]
+        total_area += a_i; sum_severity += s_i; sum_term += (s_i * a_i) / A; n_valid += 1
+    return sum_term, total_area, sum_severity, n_valid
+
+
+def _acneai_accumulate_numpy(xyxy, severities, A):
+    """Vectorized equivalent of _acneai_accumulate_loop, used when numba isn't installed."""
+    wh = xyxy[:, 2:4] - xyxy[:, 0:2]; valid = (wh[:, 0] > 0) & (wh[:, 1] > 0)
+    areas = wh[valid, 0] * wh[valid, 1]; s = severities[valid]
+    return float(np.dot(s, areas)) / A, float(areas.sum()), float(s.sum()), int(np.count_nonzero(valid))
+
+
+# Compiled to a native loop on first call (and cached on disk) when numba is available
+_acneai_accumulate = njit(cache=True, fastmath=True)(_acneai_accumulate_loop) if njit is not None else _acneai_accumulate_numpy
+# Compile (or load from the cache) at import, so the first request doesn't pay for it
+if njit is not None: _acneai_accumulate(np.zeros((1, 4), dtype=np.float64), np.zeros(1, dtype=np.float64), 1.0)
+
+
+def _calculate_acneai_score(detections, image_shape, severity_map, default_s_i, severity_lut=None, severities=None):
     """
-    Calculates score based on AcneAI paper (Eq 3). (Function body remains the same)
+    Calculates score based on AcneAI paper (Eq 3) from _extract_detections output.
+    severity_lut (optional) is a precomputed class-id -> s_i table (see _model_severity_lut);
+    severities (optional) are the per-box s_i already gathered from it.
     Returns: score_S, percentage_affected_area, average_intensity, N
     """
     score_range=(0, 100)
-    if not detection_results or len(detection_results) == 0: return score_range[0], 0.0, 0.0, 0
+    if not detections or len(detections['cls']) == 0: return score_range[0], 0.0, 0.0, 0
     if not isinstance(image_shape, tuple) or len(image_shape) < 2: return score_range[0], 0.0, 0.0, 0
-    try:
-        result = detection_results[0]; boxes = result.boxes; names = getattr(result, 'names', {});
-        if not isinstance(names, dict): names = {}
-        img_h, img_w = image_shape[:2]; A = float(img_h * img_w)
-    except (AttributeError, IndexError) as e: return score_range[0], 0.0, 0.0, 0
-    N_total_boxes = len(boxes) if boxes is not None else 0
-    if N_total_boxes == 0 or A <= 0: return score_range[0], 0.0, 0.0, 0
-    sum_term = 0.0; total_lesion_area = 0.0; sum_severity_points = 0.0; valid_detections = 0
-    for box in boxes:
-         try:
-            x1, y1, x2, y2 = box.xyxy[0].cpu().numpy(); w = x2 - x1; h = y2 - y1
-            if w <= 0 or h <= 0: continue
-            a_i = float(w * h); total_lesion_area += a_i
-            class_id = int(box.cls[0]); class_name = names.get(class_id, f"class_{class_id}")
-            s_i = severity_map.get(class_name, default_s_i); sum_severity_points += s_i
-            sum_term += (s_i * a_i) / A; valid_detections += 1
-         except (AttributeError, IndexError, TypeError) as e: continue
-    N = valid_detections
+    img_h, img_w = image_shape[:2]; A = float(img_h * img_w)
+    if A <= 0: return score_range[0], 0.0, 0.0, 0
+    xyxy = np.ascontiguousarray(detections['xyxy'], dtype=np.float64)
+    if severities is None: _, severities = _class_severities(detections, severity_map, default_s_i, severity_lut)
+    sum_term, total_lesion_area, sum_severity_points, N = _acneai_accumulate(xyxy, severities, A)
     if N == 0: return score_range[0], 0.0, 0.0, 0
     try:
         inner_term = 20.0 * sum_term; score_S = (200.0 / math.pi) * math.atan(inner_term)
@@ -107,13 +273,269 @@ def calculate_acneai_score(detection_results, image_shape, severity_map, default
     return score_S, percentage_affected_area, average_intensity, N
 
 
-# --- Main Analysis Function ---
+def _score_and_heatmap(detections, image, severity_map, default_s_i, severity_lut=None, **heatmap_kwargs):
+    """
+    Scores one image and renders its heatmap from a single _extract_detections output,
+    gathering the per-box severities once for both.
+    Returns: (score_S, percentage_affected_area, average_intensity, N), (heatmap_overlay, heatmap_norm)
+    """
+    severities = None
+    if detections and len(detections['cls']) > 0:
+        _, severities = _class_severities(detections, severity_map, default_s_i, severity_lut)
+    score = _calculate_acneai_score(detections, image.shape, severity_map, default_s_i, severities=severities)
+    heatmap = _generate_spread_heatmap(image, detections, severity_map, default_s_i, severities=severities, **heatmap_kwargs)
+    return score, heatmap
+
+
+def generate_spread_heatmap(image, detection_results, severity_map, default_s_i,
+                            weighting=DEFAULT_HEATMAP_WEIGHTING, alpha=DEFAULT_HEATMAP_ALPHA,
+                            spread_sigma=DEFAULT_GAUSSIAN_SPREAD_SIGMA,
+                            secondary_blur_ksize=DEFAULT_SECONDARY_BLUR_KERNEL_SIZE,
+                            colormap=DEFAULT_COLORMAP):
+    """Generates a heatmap overlay from YOLO detection results (see _generate_spread_heatmap)."""
+    if not isinstance(image, np.ndarray) or image.ndim != 3: return image, np.zeros(image.shape[:2] if isinstance(image, np.ndarray) else (100, 100), dtype=np.float32)
+    image = np.ascontiguousarray(image, dtype=np.uint8)
+    return _generate_spread_heatmap(image, _extract_detections(detection_results), severity_map, default_s_i,
+                                    weighting=weighting, alpha=alpha, spread_sigma=spread_sigma,
+                                    secondary_blur_ksize=secondary_blur_ksize, colormap=colormap)
+
+
+def calculate_acneai_score(detection_results, image_shape, severity_map, default_s_i):
+    """
+    Calculates score based on AcneAI paper (Eq 3) from YOLO detection results (see _calculate_acneai_score).
+    Returns: score_S, percentage_affected_area, average_intensity, N
+    """
+    return _calculate_acneai_score(_extract_detections(detection_results), image_shape, severity_map, default_s_i)
+
+
+def _load_model(model_path):
+    """
+    Returns the cached YOLO model for model_path, loading it on first use.
+    With CUDA available, a .pt model is swapped for a TensorRT FP16 engine built next to it
+    (reused on later runs, and rebuilt when the .pt is newer); if the export fails the PyTorch weights are used.
+    """
+    model = _MODEL_CACHE.get(model_path)
+    if model is not None: return model
+    print(f"--- Loading Model: {model_path} ---")
+    model = YOLO(model_path); loaded_path = model_path
+    if torch.cuda.is_available() and model_path.endswith('.pt'):
+        engine_path = os.path.splitext(model_path)[0] + '.engine'
+        try:
+            # An engine older than the weights was built from a previous .pt (retrained or replaced since)
+            if not os.path.exists(engine_path) or os.path.getmtime(model_path) > os.path.getmtime(engine_path):
+                print(f"--- Exporting TensorRT engine: {engine_path} ---")
+                engine_path = model.export(format='engine', half=True, imgsz=DEFAULT_ENGINE_IMGSZ, device=0,
+                                            dynamic=True, batch=DEFAULT_PREDICT_BATCH)
+            model = YOLO(engine_path, task='detect'); loaded_path = engine_path
+        except Exception as e: print(f"TensorRT engine unavailable, using PyTorch weights: {e}")
+    print(f"Model loaded from: {loaded_path}")
+    _MODEL_CACHE[model_path] = model
+    return model
+
+
+# --- Main Analysis Functions ---
+def _new_results():
+    """Returns a results dictionary initialized with defaults (see analyze_skin_image)."""
+    return {
+        'success': False, 'message': 'Analysis not started.',
+        'severity_score': 0.0, 'percentage_area': 0.0, # Initialize with defaults
+        'average_intensity': 0.0, 'lesion_count': 0,
+        'original_image_bgr': None, 'heatmap_overlay_bgr': None, 'heatmap_overlay_base64': None,
+        'detections': [], 'model_classes': {}
+    }
+
+
+def _encode_overlay_base64(overlay):
+    """PNG-encodes a BGR overlay and returns it as a base64 string (None if encoding fails)."""
+    success, buffer = cv2.imencode('.png', overlay)
+    return base64.b64encode(buffer).decode('utf-8') if success else None
+
+
+def _letterbox(image_bgr, imgsz=DEFAULT_ENGINE_IMGSZ):
+    """
+    Resizes image_bgr (keeping its aspect ratio) and pads it to imgsz x imgsz with YOLO's gray.
+    Returns: padded image, (ratio, (pad_x, pad_y), (h, w)) for _extract_detections
+    """
+    img_h, img_w = image_bgr.shape[:2]; ratio = min(imgsz / img_h, imgsz / img_w)
+    new_w = int(round(img_w * ratio)); new_h = int(round(img_h * ratio))
+    resized = image_bgr if (new_w, new_h) == (img_w, img_h) else cv2.resize(image_bgr, (new_w, new_h), interpolation=cv2.INTER_LINEAR)
+    pad_x = (imgsz - new_w) // 2; pad_y = (imgsz - new_h) // 2
+    padded = cv2.copyMakeBorder(resized, pad_y, imgsz - new_h - pad_y, pad_x, imgsz - new_w - pad_x,
+                                cv2.BORDER_CONSTANT, value=(114, 114, 114))
+    return padded, (ratio, (pad_x, pad_y), (img_h, img_w))
+
+
+def _input_tensor(padded_images):
+    """Stacks letterboxed BGR uint8 images into the BCHW RGB 0..1 float CUDA tensor predict takes as-is."""
+    buffer = getattr(_PINNED_INPUT, 'buffer', None)
+    if buffer is None:
+        buffer = _PINNED_INPUT.buffer = torch.empty((DEFAULT_PREDICT_BATCH, DEFAULT_ENGINE_IMGSZ, DEFAULT_ENGINE_IMGSZ, 3), dtype=torch.uint8).pin_memory()
+    # Stacked straight into pinned memory (reused: the previous batch's results were copied back before this one)
+    batch = buffer[:len(padded_images)]
+    np.stack(padded_images, out=batch.numpy())
+    # Moved to the GPU as uint8 (a quarter of the float32 bytes) and converted there
+    return batch.to(0, non_blocking=True).permute(0, 3, 1, 2).flip(1).float().div_(255.0)
+
+
+def _run_batch(model, images, conf):
+    """
+    Predicts on BGR arrays in chunks of DEFAULT_PREDICT_BATCH, yielding (Results, letterbox) per image.
+    On GPU, each chunk is letterboxed here once to the engine's square input and passed as a tensor,
+    so ultralytics skips its own per-image letterbox and conversion. On CPU the arrays go to ultralytics
+    as they are (its own letterbox, and boxes already in image coordinates: letterbox is None).
+    Streamed, so only the current chunk's Results are held.
+    """
+    for start in range(0, len(images), DEFAULT_PREDICT_BATCH):
+        chunk = images[start:start + DEFAULT_PREDICT_BATCH]
+        if torch.cuda.is_available():
+            padded, letterboxes = zip(*(_letterbox(image) for image in chunk))
+            source = _input_tensor(padded)
+        else:
+            source = list(chunk); letterboxes = [None] * len(chunk)
+        predictions = model.predict(source=source, conf=conf, save=False, stream=True, **_PREDICT_KWARGS)
+        yield from zip(predictions, letterboxes)
+
+
+def _analyze_prediction(results, image_bgr, predict_results, severity_map, default_severity,
+                        heatmap_alpha, heatmap_sigma, severity_lut=None, letterbox=None, encode_overlay=False):
+    """
+    Fills results with the score, heatmap and detections for one image's predictions.
+    With encode_overlay, the overlay's base64 PNG is started on _IO_POOL (collected by analyze_skin_images).
+    """
+    # Box arrays copied off the device once and shared by the score, heatmap and detections list
+    detections = _extract_detections(predict_results, letterbox)
+
+    # --- Calculate Score using AcneAI Formula and Generate Heatmap ---
+    print("\n--- Calculating Severity Score (AcneAI Formula) ---")
+    print(f"--- Generating Heatmap (Sigma: {heatmap_sigma}, Alpha: {heatmap_alpha}) ---")
+    (score, perc_a, avg_i, n_lesions), (heatmap_overlay, _) = _score_and_heatmap(
+        detections,
+        image_bgr, # Use original BGR for blending
+        severity_map, # Use the same map for heatmap intensity weighting
+        default_severity,
+        severity_lut=severity_lut,
+        alpha=heatmap_alpha,
+        spread_sigma=heatmap_sigma
+        # Add other heatmap params if needed (e.g., weighting='severity')
+    )
+    # Store results in the dictionary
+    results.update({
+        'severity_score': score, # Store AcneAI score under the standard key
+        'percentage_area': perc_a,
+        'average_intensity': avg_i,
+        'lesion_count': n_lesions
+    })
+    print(f"Score calculated: {score:.2f}")
+    results['heatmap_overlay_bgr'] = heatmap_overlay
+    if encode_overlay: results['heatmap_overlay_future'] = _IO_POOL.submit(_encode_overlay_base64, heatmap_overlay)
+    print("Heatmap generated.")
+
+    # --- Extract Detections ---
+    names_map = results['model_classes']
+    results['detections'] = [{'class_name': names_map.get(class_id, f"class_{class_id}"), 'confidence': float(confidence)}
+                             for class_id, confidence in zip(detections['cls'].tolist(), detections['conf'])]
+
+    results['success'] = True
+    results['message'] = 'Analysis completed successfully using AcneAI score formula.'
+
+
+def analyze_skin_images(model_path, image_paths,
+                        conf_threshold=DEFAULT_CONFIDENCE_THRESHOLD,
+                        severity_map=DEFAULT_SEVERITY_SCORE_MAP,
+                        default_severity=DEFAULT_SEVERITY_SCORE,
+                        heatmap_alpha=DEFAULT_HEATMAP_ALPHA,
+                        heatmap_sigma=DEFAULT_GAUSSIAN_SPREAD_SIGMA,
+                        encode_overlay=False
+                        ):
+    """
+    Batch version of analyze_skin_image: all readable images go through a single
+    model.predict call so they share forward passes on the loaded model.
+    With encode_overlay, each overlay is PNG-encoded in the background while the next image is predicted.
+
+    Args:
+        model_path (str): Path to the trained YOLOv8 model (.pt file).
+        image_paths (list): Paths to the input image files.
+        Other arguments as for analyze_skin_image.
+
+    Returns:
+        list: One results dictionary (see analyze_skin_image) per entry of image_paths, in order.
+    """
+    # Initialize one results dictionary per image
+    all_results = [_new_results() for _ in image_paths]
+
+    # --- Validate Inputs ---
+    if not os.path.exists(model_path):
+        for results in all_results: results['message'] = f"Model file not found: {model_path}"
+        return all_results
+
+    try:
+        # --- Load Model (cached across calls) ---
+        model = _load_model(model_path)
+        model_classes = getattr(model, 'names', {});
+        if not isinstance(model_classes, dict): model_classes = {}
+        print(f"Model loaded. Classes: {model_classes}")
+        severity_lut = _model_severity_lut(model_path, model_classes, severity_map, default_severity)
+    except Exception as e:
+        for results in all_results: results['message'] = f"An unexpected error occurred: {e}"
+        print(f"\nERROR: An unexpected error occurred: {e}"); traceback.print_exc()
+        return all_results
+
+    # --- Read Images ---
+    batch = [] # (results, image_bgr) for each readable image
+    readable = [] # (results, image_path) for each existing file
+    for results, image_path in zip(all_results, image_paths):
+        results['model_classes'] = model_classes
+        if not os.path.exists(image_path): results['message'] = f"Image file not found: {image_path}"; continue
+        readable.append((results, image_path))
+    # Decoded in parallel on the I/O pool
+    decoded = _IO_POOL.map(cv2.imread, [image_path for _, image_path in readable])
+    for (results, image_path), image_bgr in zip(readable, decoded):
+        print(f"\n--- Reading Image: {image_path} ---")
+        if image_bgr is None: results['message'] = f"File Error: Could not read image file: {image_path}"; print(f"ERROR: {results['message']}"); continue
+        # Nothing downstream writes into image_bgr (the overlay is a new array), so no copy is kept
+        results['original_image_bgr'] = image_bgr
+        print(f"Image shape: {image_bgr.shape}")
+        batch.append((results, image_bgr))
+    if not batch: return all_results
+
+    done = 0 # Images whose prediction has been consumed
+    try:
+        # --- Run Prediction ---
+        # On the decoded arrays, so ultralytics doesn't read and decode each file a second time
+        print(f"\n--- Running Prediction on {len(batch)} image(s) (Confidence: {conf_threshold}) ---")
+        predictions = _run_batch(model, [image_bgr for _, image_bgr in batch], conf_threshold)
+        for (results, image_bgr), (prediction, letterbox) in zip(batch, predictions):
+            done += 1
+            try:
+                _analyze_prediction(results, image_bgr, [prediction], severity_map, default_severity,
+                                    heatmap_alpha, heatmap_sigma, severity_lut=severity_lut, letterbox=letterbox,
+                                    encode_overlay=encode_overlay)
+            except ImportError as e: results['message'] = f"Import Error: Missing library. {e}."; print(f"ERROR: {results['message']}")
+            except Exception as e: results['message'] = f"An unexpected error occurred: {e}"; print(f"\nERROR: {results['message']}"); traceback.print_exc()
+            # Release this image's Results before the generator produces the next one
+            del prediction
+    except Exception as e:
+        # Prediction failed mid-stream: every image not yet reached gets the error
+        for results, _ in batch[done:]: results['message'] = f"An unexpected error occurred: {e}"
+        print(f"\nERROR: An unexpected error occurred: {e}"); traceback.print_exc()
+
+    # --- Collect Encoded Heatmaps ---
+    for results, _ in batch:
+        future = results.pop('heatmap_overlay_future', None)
+        if future is None: continue
+        try: results['heatmap_overlay_base64'] = future.result()
+        except Exception as e: print(f"Error encoding heatmap image to Base64: {e}")
+
+    return all_results
+
+
 def analyze_skin_image(model_path, image_path,
                        conf_threshold=DEFAULT_CONFIDENCE_THRESHOLD,
                        severity_map=DEFAULT_SEVERITY_SCORE_MAP,
                        default_severity=DEFAULT_SEVERITY_SCORE,
                        heatmap_alpha=DEFAULT_HEATMAP_ALPHA,
-                       heatmap_sigma=DEFAULT_GAUSSIAN_SPREAD_SIGMA
+                       heatmap_sigma=DEFAULT_GAUSSIAN_SPREAD_SIGMA,
+                       encode_overlay=False
                        # Add other heatmap/score params as needed
                        ):
     """
@@ -128,6 +550,7 @@ def analyze_skin_image(model_path, image_path,
         default_severity (int/float): Default severity score (s_i) for unmapped classes.
         heatmap_alpha (float): Transparency for the heatmap overlay.
         heatmap_sigma (float): Sigma value for Gaussian spread heatmap.
+        encode_overlay (bool): Also return the overlay PNG-encoded as base64.
 
     Returns:
         dict: A dictionary containing results:
@@ -139,92 +562,43 @@ def analyze_skin_image(model_path, image_path,
          y     'lesion_count' (int): Info: Number of valid lesions detected and used in score.
               'original_image_bgr' (np.ndarray): Original image loaded (BGR).
               'heatmap_overlay_bgr' (np.ndarray): Image with heatmap overlay (BGR).
+              'heatmap_overlay_base64' (str): The overlay PNG-encoded as base64 (None unless encode_overlay, or if encoding failed).
               'detections' (list): List of detected objects (class_name, confidence).
               'model_classes' (dict): Class mapping from the loaded model.
     """
-    # Initialize results dictionary
-    results = {
-        'success': False, 'message': 'Analysis not started.',
-        'severity_score': 0.0, 'percentage_area': 0.0, # Initialize with defaults
-        'average_intensity': 0.0, 'lesion_count': 0,
-        'original_image_bgr': None, 'heatmap_overlay_bgr': None,
-        'detections': [], 'model_classes': {}
-    }
+    return analyze_skin_images(model_path, [image_path], conf_threshold=conf_threshold,
+                               severity_map=severity_map, default_severity=default_severity,
+                               heatmap_alpha=heatmap_alpha, heatmap_sigma=heatmap_sigma,
+                               encode_overlay=encode_overlay)[0]
 
-    # --- Validate Inputs ---
-    if not os.path.exists(model_path): results['message'] = f"Model file not found: {model_path}"; return results
-    if not os.path.exists(image_path): results['message'] = f"Image file not found: {image_path}"; return results
 
-    try:
-        # --- Load Model ---
-        print(f"--- Loading Model: {model_path} ---")
-        model = YOLO(model_path)
-        results['model_classes'] = getattr(model, 'names', {});
-        if not isinstance(results['model_classes'], dict): results['model_classes'] = {}
-        print(f"Model loaded. Classes: {results['model_classes']}")
-
-        # --- Read Image ---
-        print(f"\n--- Reading Image: {image_path} ---")
-        image_bgr = cv2.imread(image_path)
-        if image_bgr is None: raise IOError(f"Could not read image file: {image_path}")
-        results['original_image_bgr'] = image_bgr.copy()
-        original_shape = image_bgr.shape
-        print(f"Image shape: {original_shape}")
+def _init_cpu_worker():
+    """Process pool initializer: one intra-op thread per worker, so workers don't contend for cores."""
+    torch.set_num_threads(1)
 
-        # --- Run Prediction ---
-        print(f"\n--- Running Prediction (Confidence: {conf_threshold}) ---")
-        predict_results = model.predict(source=image_path, conf=conf_threshold, save=False)
-
-        # --- Calculate Score using AcneAI Formula ---
-        print("\n--- Calculating Severity Score (AcneAI Formula) ---")
-        # Call the correct scoring function
-        score, perc_a, avg_i, n_lesions = calculate_acneai_score(
-            predict_results,
-            original_shape,
-            severity_map,
-            default_severity
-        )
-        # Store results in the dictionary
-        results.update({
-            'severity_score': score, # Store AcneAI score under the standard key
-            'percentage_area': perc_a,
-            'average_intensity': avg_i,
-            'lesion_count': n_lesions
-        })
-        print(f"Score calculated: {score:.2f}")
-
-        # --- Generate Heatmap ---
-        print(f"\n--- Generating Heatmap (Sigma: {heatmap_sigma}, Alpha: {heatmap_alpha}) ---")
-        heatmap_overlay, _ = generate_spread_heatmap(
-            image_bgr, # Use original BGR for blending
-            predict_results,
-            severity_map, # Use the same map for heatmap intensity weighting
-            default_severity,
-            alpha=heatmap_alpha,
-            spread_sigma=heatmap_sigma
-            # Add other heatmap params if needed (e.g., weighting='severity')
-        )
-        results['heatmap_overlay_bgr'] = heatmap_overlay
-        print("Heatmap generated.")
-
-        # --- Extract Detections ---
-        if predict_results and len(predict_results) > 0 and hasattr(predict_results[0], 'boxes') and len(predict_results[0].boxes) > 0:
-            names_map = results['model_classes']
-            for box in predict_results[0].boxes:
-                try:
-                    class_id = int(box.cls[0]); confidence = float(box.conf[0])
-                    class_name = names_map.get(class_id, f"class_{class_id}")
-                    results['detections'].append({'class_name': class_name, 'confidence': confidence})
-                except (AttributeError, IndexError, TypeError): continue
-
-        results['success'] = True
-        results['message'] = 'Analysis completed successfully using AcneAI score formula.'
-
-    except (FileNotFoundError, IOError) as e: results['message'] = f"File Error: {e}"; print(f"ERROR: {results['message']}")
-    except ImportError as e: results['message'] = f"Import Error: Missing library. {e}."; print(f"ERROR: {results['message']}")
-    except Exception as e: results['message'] = f"An unexpected error occurred: {e}"; print(f"\nERROR: {results['message']}"); traceback.print_exc()
-
-    return results
+
+def analyze_skin_images_parallel(model_path, image_paths, workers=4, **kwargs):
+    """
+    CPU-only batch analysis: images are spread over a pool of single-threaded worker processes,
+    each loading the model once (see _load_model). On CUDA this defers to analyze_skin_images,
+    whose batched GPU predictions are faster.
+
+    Args:
+        model_path (str): Path to the trained YOLOv8 model (.pt file).
+        image_paths (list): Paths to the input image files.
+        workers (int): Number of worker processes.
+        kwargs: Other arguments as for analyze_skin_image.
+
+    Returns:
+        list: One results dictionary (see analyze_skin_image) per entry of image_paths, in order.
+    """
+    if torch.cuda.is_available() or workers <= 1 or len(image_paths) <= 1:
+        return analyze_skin_images(model_path, image_paths, **kwargs)
+    # Spawned, not forked: a forked child would inherit _IO_POOL without its threads and hang on it
+    with ProcessPoolExecutor(max_workers=min(workers, len(image_paths)), initializer=_init_cpu_worker,
+                             mp_context=multiprocessing.get_context("spawn")) as pool:
+        futures = [pool.submit(analyze_skin_image, model_path, image_path, **kwargs) for image_path in image_paths]
+        return [future.result() for future in futures]
 
 
 # --- Example Usage ---
@@ -59,12 +59,25 @@ def prepare_data_yaml(dataset_dir, class_names):
     }
     if os.path.isdir(test_img_path): data_yaml['test'] = os.path.join('test', 'images')
 
+    content = yaml.dump(data_yaml, default_flow_style=False, sort_keys=False)
+    # Leave an identical file alone, so its mtime (and Ultralytics' dataset caches) aren't touched
     try:
-        with open(yaml_path, 'w') as f: yaml.dump(data_yaml, f, default_flow_style=False, sort_keys=False)
+        with open(yaml_path) as f: unchanged = f.read() == content
+    except OSError: unchanged = False
+    if unchanged:
+        print(f"\ndata.yaml up to date at: {yaml_path}")
+        return yaml_path
+
+    try:
+        # Written to a per-process temp file and swapped in, so parallel runs never read a partial file
+        tmp_path = f"{yaml_path}.{os.getpid()}.tmp"
+        with open(tmp_path, 'w') as f: f.write(content)
+        os.replace(tmp_path, yaml_path)
         print(f"\nCreated data.yaml at: {yaml_path}")
     except Exception as e:
         print(f"Error writing data.yaml file: {e}")
         raise SystemExit("Failed to create data.yaml")
+    return yaml_path
 
 def train_model(data_yaml_path, model_name, epochs, batch_size, img_size, project_name, run_name, device):
     """Loads and trains the YOLOv8 model."""
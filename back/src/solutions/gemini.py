@@ -1,6 +1,12 @@
 import os
 import datetime
 import json
+import asyncio
+from typing import List
+try:
+    from orjson import loads as _json_loads # Optional: faster parsing of plan responses
+except ImportError:
+    _json_loads = json.loads
 
 # pip install --upgrade google-genai
 from google import genai
@@ -12,8 +18,7 @@ def configure_gemini(api_key_env: str = "GOOGLE_API_KEY", use_vertex: bool = Tru
         raise RuntimeError(f"Set {api_key_env} to your Google API key.")
     return genai.Client(api_key=api_key, vertexai=use_vertex)
 
-def generate_skin_plan_gemini(
-    client: genai.Client,
+def _skin_plan_request(
     disease: str,
     severity_score: int,
     sex: str,
@@ -22,8 +27,8 @@ def generate_skin_plan_gemini(
     previous_treatment: str,
     diet: str,
     actual_date: str,
-    model: str = "gemini-1.5-turbo",
-) -> dict:
+) -> tuple:
+    """Builds the (prompt, config) pair shared by the sync and async plan generators."""
     prompt = (
         "You are a knowledgeable medical assistant specializing in dermatology. "
         "Given the patient data below, provide:\n"
@@ -47,15 +52,55 @@ def generate_skin_plan_gemini(
         top_p=0.9,
         max_output_tokens=512,
     )
+    return prompt, config
 
+def generate_skin_plan_gemini(
+    client: genai.Client,
+    disease: str,
+    severity_score: int,
+    sex: str,
+    age: int,
+    weight: float,
+    previous_treatment: str,
+    diet: str,
+    actual_date: str,
+    model: str = "gemini-1.5-turbo",
+) -> dict:
+    prompt, config = _skin_plan_request(
+        disease, severity_score, sex, age, weight, previous_treatment, diet, actual_date
+    )
     response = client.models.generate_content(
         model=model,
         contents=prompt,        # str or list/Content both work
         config=config           # <- correct keyword
     )
-    return json.loads(response.text)
+    return _json_loads(response.text)
 
-def generate_skin_plan_from_json(input_json: dict, client: genai.Client) -> dict:
+async def generate_skin_plan_gemini_async(
+    client: genai.Client,
+    disease: str,
+    severity_score: int,
+    sex: str,
+    age: int,
+    weight: float,
+    previous_treatment: str,
+    diet: str,
+    actual_date: str,
+    model: str = "gemini-1.5-turbo",
+) -> dict:
+    """Async variant of generate_skin_plan_gemini, so several plans can be in flight at once."""
+    prompt, config = _skin_plan_request(
+        disease, severity_score, sex, age, weight, previous_treatment, diet, actual_date
+    )
+    response = await client.aio.models.generate_content(
+        model=model,
+        contents=prompt,
+        config=config
+    )
+    return _json_loads(response.text)
+
+def _skin_plan_kwargs(input_json: dict) -> dict:
+    """Validates an input JSON and maps it to generate_skin_plan_gemini keyword arguments."""
     required = [
         "disease", "severity_score", "sex", "age",
         "weight", "previous_treatment", "diet", "actual_date"
@@ -64,8 +109,7 @@ def generate_skin_plan_from_json(input_json: dict, client: genai.Client) -> dict
     if missing:
         raise ValueError(f"Missing keys in input JSON: {missing}")
 
-    return generate_skin_plan_gemini(
-        client=client,
+    return dict(
         disease=input_json["disease"],
         severity_score=int(input_json["severity_score"]),
         sex=input_json["sex"],
@@ -76,6 +120,17 @@ def generate_skin_plan_from_json(input_json: dict, client: genai.Client) -> dict
         actual_date=input_json["actual_date"],
     )
 
+def generate_skin_plan_from_json(input_json: dict, client: genai.Client) -> dict:
+    return generate_skin_plan_gemini(client=client, **_skin_plan_kwargs(input_json))
+
+async def generate_skin_plans_from_json(input_jsons: List[dict], client: genai.Client) -> List[dict]:
+    """Generates one plan per input concurrently: total latency is the slowest call, not the sum."""
+    # Validate everything up front so a bad input fails before any request is sent
+    kwargs_list = [_skin_plan_kwargs(input_json) for input_json in input_jsons]
+    return await asyncio.gather(
+        *(generate_skin_plan_gemini_async(client=client, **kwargs) for kwargs in kwargs_list)
+    )
+
 def test_generate_skin_plan():
     client = configure_gemini()  # reads GOOGLE_API_KEY
     sample = {
@@ -1,23 +1,510 @@
+import asyncio
 import datetime
 import json
+import math
 import os
-import ollama
-from typing import Dict, Optional
+import string
+import threading
+import time
+import weakref
+from collections import OrderedDict
+from functools import lru_cache
+from typing import TYPE_CHECKING, Dict, List, Optional, Tuple
 from datetime import datetime, date
-import requests
+try:
+    # Optional: faster encoding/decoding of plans (the cache and fallback plan are stored encoded)
+    from orjson import dumps as _json_dumps, loads as _json_loads
+except ImportError:
+    def _json_dumps(obj) -> bytes:
+        return json.dumps(obj, separators=(',', ':')).encode()
+    _json_loads = json.loads
+
+# ollama, httpx and requests are imported on first use rather than here, so importing this module
+# (e.g. for build_search_query, or in a short-lived process) doesn't pay for the HTTP stacks
+if TYPE_CHECKING:
+    import httpx
+
+__all__ = [
+    "DEFAULT_PLAN_MODEL",
+    "calculate_age",
+    "generate_skin_plan",
+    "generate_skin_plan_async",
+    "generate_skin_plan_vllm",
+    "generate_skin_plan_vllm_async",
+    "preload_skin_model_async",
+    "generate_skin_plan_from_json",
+    "generate_skin_plans_from_json",
+    "build_search_query",
+    "search_products_google",
+]
+
+# Model used when a caller doesn't name one (also what the API preloads at startup)
+DEFAULT_PLAN_MODEL = "llama2"
+
+# Ollama runs at most OLLAMA_NUM_PARALLEL requests per model at once (and OLLAMA_MAX_LOADED_MODELS models)
+# and queues the rest; backend="vllm" sends plans to a vLLM OpenAI-compatible server instead, whose
+# continuous batching decodes concurrent plans together
+VLLM_BASE_URL = os.environ.get("VLLM_BASE_URL", "http://vllm:8000/v1")
+
+def _http_options() -> Dict:
+    """Connection settings shared by every client: generation can be slow, connecting should not be."""
+    import httpx
+    return {
+        'timeout': httpx.Timeout(300.0, connect=10.0),
+        'limits': httpx.Limits(max_connections=100, max_keepalive_connections=40, keepalive_expiry=30.0)
+    }
+
+# Shared clients, created on first use, so every call reuses pooled keep-alive connections instead of
+# opening its own; the Ollama host defaults to OLLAMA_HOST (or the local server)
+@lru_cache(maxsize=None)
+def _client():
+    import ollama
+    return ollama.Client(**_http_options())
+
+# Async clients and semaphores belong to the event loop they were first used in, so each loop
+# (e.g. each asyncio.run()) gets its own, dropped along with the loop
+_PER_LOOP: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, Dict]" = weakref.WeakKeyDictionary()
+
+def _per_loop(name: str, factory):
+    """Returns the running loop's object called name, created with factory on first use in that loop."""
+    objects = _PER_LOOP.setdefault(asyncio.get_running_loop(), {})
+    if name not in objects:
+        objects[name] = factory()
+    return objects[name]
+
+def _async_client():
+    import ollama
+    return _per_loop('ollama', lambda: ollama.AsyncClient(**_http_options()))
+
+@lru_cache(maxsize=None)
+def _vllm_client():
+    import httpx
+    return httpx.Client(base_url=VLLM_BASE_URL, **_http_options())
+
+def _vllm_async_client():
+    import httpx
+    return _per_loop('vllm', lambda: httpx.AsyncClient(base_url=VLLM_BASE_URL, **_http_options()))
 
 def calculate_age(dob: str) -> int:
     """Calculate age from date of birth string (YYYY-MM-DD format)"""
-    birth_date = datetime.strptime(dob, "%Y-%m-%d").date()
+    # fromisoformat is a C parser for exactly this format; strptime re-interprets its format string per call
+    birth_date = date.fromisoformat(dob)
     today = date.today()
     age = today.year - birth_date.year - ((today.month, today.day) < (birth_date.month, birth_date.day))
     return age
 
+_CHAT_OPTIONS = {
+    'temperature': 0.7,
+    'top_p': 0.9,
+    'num_predict': 1024 # Ollama's cap on generated tokens (it ignores 'max_tokens')
+}
+# Keeps the model loaded between requests (Ollama's default unloads it after 5 minutes), so its
+# cached KV for the shared system-prompt prefix survives gaps in traffic and is reused
+_KEEP_ALIVE = '30m'
+# Async plan calls in flight at once: Ollama only runs OLLAMA_NUM_PARALLEL together and queues the rest,
+# so a large batch is fed to it at that rate instead of all at once
+_OLLAMA_PARALLEL = int(os.environ.get("OLLAMA_NUM_PARALLEL", "4"))
+# Retries of a plan call after a connection failure, a timeout, or a 429/5xx from the server, with exponential backoff
+_RETRIES = 2
+_RETRY_BACKOFF = 0.5 # seconds before the first retry
+
+# Static part of the plan prompt (instructions and JSON schema), identical for every patient. It comes
+# before the patient data so that Ollama's prompt cache can reuse the KV of this shared prefix
+_STATIC_PROMPT_HEADER = (
+    "You are a knowledgeable medical assistant specializing in dermatology. Given the patient data below, provide a JSON response with the following structure:\n"
+    "{\n"
+    "  \"treatment_plan\": [{\n"
+    "    \"date\": \"YYYY-MM-DD\",\n"
+    "    \"treatment\": \"treatment description\"\n"
+    "  }],\n"
+    "  \"lifestyle_advice\": [\"advice 1\", \"advice 2\"],\n"
+    "  \"diet_recommendations\": [\"diet rec 1\", \"diet rec 2\"],\n"
+    "  \"sleep_recommendations\": [\"sleep rec 1\", \"sleep rec 2\"],\n"
+    "  \"environmental_factors\": [\"env factor 1\", \"env factor 2\"],\n"
+    "  \"product_recommendations\": [{\n"
+    "    \"skin_condition\": \"acne/rosacea/dryness/etc\",\n"
+    "    \"skin_type\": \"oily/dry/combination/sensitive\",\n"
+    "    \"characteristics\": [\"non-comedogenic\", \"fragrance-free\", etc],\n"
+    "    \"price_range\": \"budget/mid-range/premium\",\n"
+    "    \"constitution\": [\"oil-free\", \"alcohol-free\", etc],\n"
+    "    \"product_type\": \"cleanser/moisturizer/serum/etc\"\n"
+    "  }]\n"
+    "}\n\n"
+    "IMPORTANT: Your response must be a valid JSON object. Do not include any text before or after the JSON. "
+    "Make sure all strings are properly quoted with double quotes. "
+    "Arrays must be enclosed in square brackets. "
+    "Objects must be enclosed in curly braces. "
+    "All keys must be strings enclosed in double quotes. "
+    "Provide ONLY the JSON response with NO additional text or explanation.\n\n"
+)
+# Per-patient part, filled with str.format_map and appended to the header
+_PATIENT_SECTION_TEMPLATE = (
+    "Patient Data:\n"
+    "- Age: {age}\n"
+    "- Gender: {gender}\n"
+    "- Weight (kg): {weight}\n"
+    "- Height (cm): {height}\n"
+    "- Acne Severity Score (1-100): {acne_severity_score}\n"
+    "- Current Diet Patterns:\n"
+    "  * Sugar intake: {diet_sugar}%\n"
+    "  * Dairy intake: {diet_dairy}%\n"
+    "  * Alcohol consumption: {diet_alcohol}%\n"
+    "- Sleep Patterns:\n"
+    "  * Hours: {sleep_hours}\n"
+    "  * Quality: {sleep_quality}\n"
+    "- Stress Level (1-10): {stress}\n"
+    "- Current Products Used: {products_used}\n"
+    "- Sunlight Exposure (hours/day): {sunlight_exposure}\n"
+)
+
+# Fallback plan when the model fails or its reply can't be used; encoded once, and each
+# caller gets a fresh decoded copy (callers may modify the plan they receive)
+_DEFAULT_PLAN_JSON = _json_dumps({
+    "treatment_plan": [
+        {
+            "date": None, # Set to today by _default_plan
+            "treatment": "Basic skincare routine: gentle cleanser, moisturizer, and sunscreen"
+        }
+    ],
+    "lifestyle_advice": [
+        "Stay hydrated",
+        "Get adequate sleep",
+        "Manage stress levels"
+    ],
+    "diet_recommendations": [
+        "Reduce sugar intake",
+        "Maintain a balanced diet",
+        "Consider reducing dairy consumption"
+    ],
+    "sleep_recommendations": [
+        "Aim for 7-9 hours of sleep",
+        "Maintain a consistent sleep schedule"
+    ],
+    "environmental_factors": [
+        "Protect skin from sun exposure",
+        "Keep environment clean and dust-free"
+    ],
+    "product_recommendations": [
+        {
+            "skin_condition": "acne",
+            "skin_type": "combination",
+            "characteristics": ["non-comedogenic", "fragrance-free"],
+            "price_range": "mid-range",
+            "constitution": ["oil-free", "alcohol-free"],
+            "product_type": "cleanser"
+        }
+    ]
+})
+
+# Top-level keys of a plan, as requested by the prompt's schema
+_PLAN_FIELDS = (
+    "treatment_plan",
+    "lifestyle_advice",
+    "diet_recommendations",
+    "sleep_recommendations",
+    "environmental_factors",
+    "product_recommendations"
+)
+
+# Plans by (model_name, prompt), most recently used last: a repeated request for the same
+# patient data is answered without another model call. Stored encoded, so hits return fresh copies.
+# Only replies that parsed into a complete plan are stored, never fallback or partial plans.
+# Entries expire after _PLAN_CACHE_TTL seconds, since a plan's treatment dates are relative to the day
+# it was generated; the lock keeps lookups and evictions from different threads apart.
+_PLAN_CACHE_SIZE = 256
+_PLAN_CACHE_TTL = 3600.0
+_plan_cache: "OrderedDict[Tuple[str, str], Tuple[float, bytes]]" = OrderedDict()
+_plan_cache_lock = threading.Lock()
+
+def _cached_plan(key: Tuple[str, str]) -> Optional[Dict]:
+    """Returns a copy of the cached plan for key, or None if there is none or it has expired."""
+    with _plan_cache_lock:
+        entry = _plan_cache.get(key)
+        if entry is None:
+            return None
+        expires_at, encoded = entry
+        if expires_at <= time.monotonic():
+            del _plan_cache[key]
+            return None
+        _plan_cache.move_to_end(key)
+    return _json_loads(encoded)
+
+def _cache_plan(key: Tuple[str, str], plan: Dict) -> None:
+    """Stores plan under key, evicting the least recently used entry when full."""
+    encoded = _json_dumps(plan)
+    with _plan_cache_lock:
+        _plan_cache[key] = (time.monotonic() + _PLAN_CACHE_TTL, encoded)
+        _plan_cache.move_to_end(key)
+        if len(_plan_cache) > _PLAN_CACHE_SIZE:
+            _plan_cache.popitem(last=False)
+
+def _default_plan() -> Dict:
+    """Returns a new copy of the fallback plan, dated today."""
+    plan = _json_loads(_DEFAULT_PLAN_JSON)
+    plan["treatment_plan"][0]["date"] = datetime.now().strftime("%Y-%m-%d")
+    return plan
+
+# Shared by every request (the message dicts are only read, never modified)
+_SYSTEM_MESSAGE = {
+    'role': 'system',
+    'content': 'You are a dermatology expert. You must respond with valid JSON only. Do not include any text before or after the JSON.'
+}
+
+# Timeseries fields used in the plan prompt, with the value assumed when a field is missing
+_TS_DEFAULTS = {
+    "acne_severity_score": 50, "diet_sugar": 0, "diet_dairy": 0,
+    "diet_alcohol": 0, "sleep_hours": 0, "sleep_quality": "unknown",
+    "stress": 0, "products_used": "", "sunlight_exposure": 0
+}
+
+# Free-text patient values are cut to these lengths (with a log line), which bounds the prompt's length;
+# the other values are numbers, whose text is never longer than _MAX_NUMBER_CHARS
+_MAX_TEXT_CHARS = {"gender": 32, "sleep_quality": 32, "products_used": 400}
+_MAX_NUMBER_CHARS = 24 # Longest repr of a float, e.g. -2.2250738585072014e-308
+# Typical for llama tokenizers on this prompt (English text and JSON punctuation)
+_CHARS_PER_TOKEN = 3.5
+_PLAN_PLACEHOLDERS = [name for _, name, _, _ in string.Formatter().parse(_PATIENT_SECTION_TEMPLATE) if name]
+_MAX_PROMPT_CHARS = (
+    len(_SYSTEM_MESSAGE['content']) + len(_STATIC_PROMPT_HEADER) + len(_PATIENT_SECTION_TEMPLATE)
+    + sum(_MAX_TEXT_CHARS.values()) + _MAX_NUMBER_CHARS * (len(_PLAN_PLACEHOLDERS) - len(_MAX_TEXT_CHARS))
+)
+# One num_ctx for every call, preload included, since Ollama reloads the model whenever num_ctx changes:
+# the longest prompt plus num_predict plus 64 tokens for the chat template, rounded up to a multiple of 256
+# (2048, Ollama's usual default). llama.cpp allocates the KV cache for the whole context up front.
+_NUM_CTX = -(-(math.ceil(_MAX_PROMPT_CHARS / _CHARS_PER_TOKEN) + _CHAT_OPTIONS['num_predict'] + 64) // 256) * 256
+# Estimated tokens of the shared prefix (system message and prompt header), kept by Ollama if the context shifts
+_STATIC_PREFIX_TOKENS = math.ceil((len(_SYSTEM_MESSAGE['content']) + len(_STATIC_PROMPT_HEADER)) / _CHARS_PER_TOKEN)
+_PLAN_OPTIONS = {**_CHAT_OPTIONS, 'num_ctx': _NUM_CTX, 'num_keep': _STATIC_PREFIX_TOKENS}
+
+def _plan_messages(user_profile: Dict, timeseries_data: Optional[Dict] = None) -> List[Dict]:
+    """Builds the Ollama chat messages for one patient (see generate_skin_plan)."""
+    # Extract and process user profile data
+    age = calculate_age(user_profile.get("dob", ""))
+    gender = user_profile.get("gender", "")
+    weight = user_profile.get("weight", 0)
+    height = user_profile.get("height", 0)
+    
+    # Process timeseries data if available
+    td = timeseries_data or {}
+    fields = {key: td.get(key, default) for key, default in _TS_DEFAULTS.items()}
+    if isinstance(fields["products_used"], list):
+        # Stored entries hold a list of product names
+        fields["products_used"] = ", ".join(fields["products_used"])
+    
+    values = {**fields, "age": age, "gender": gender, "weight": weight, "height": height}
+    # Cut overlong free text so the prompt always fits in _NUM_CTX
+    for key, max_chars in _MAX_TEXT_CHARS.items():
+        text = str(values[key])
+        if len(text) > max_chars:
+            print(f"Plan prompt: {key} cut from {len(text)} to {max_chars} characters")
+            values[key] = text[:max_chars]
+    prompt = _STATIC_PROMPT_HEADER + _PATIENT_SECTION_TEMPLATE.format_map(values)
+
+    return [_SYSTEM_MESSAGE, {'role': 'user', 'content': prompt}]
+
+class _JsonValueWatcher:
+    """
+    Tracks {}/[] nesting over streamed text (ignoring brackets inside JSON strings) to spot when the
+    first top-level JSON value that can hold a plan (an object, or an array with an object) is complete.
+    """
+
+    def __init__(self):
+        self.closers = [] # Closing bracket expected for each open level
+        self.in_string = False
+        self.escaped = False
+        self.value = [] # Text of the current top-level value
+
+    def feed(self, text: str) -> bool:
+        """Consumes the next piece of text; returns True once such a value has closed."""
+        for char in text:
+            if self.closers:
+                self.value.append(char)
+            if self.in_string:
+                if self.escaped:
+                    self.escaped = False
+                elif char == '\\':
+                    self.escaped = True
+                elif char == '"':
+                    self.in_string = False
+            elif char == '"' and self.closers:
+                self.in_string = True
+            elif char in '{[':
+                if not self.closers:
+                    self.value = [char]
+                self.closers.append('}' if char == '{' else ']')
+            elif char in '}]' and self.closers:
+                if char != self.closers[-1]:
+                    self.closers.clear() # Mismatched brackets: not JSON, start over at the next one
+                    continue
+                self.closers.pop()
+                if not self.closers and self._holds_plan():
+                    return True
+        return False
+
+    def _holds_plan(self) -> bool:
+        """Whether the value just closed is JSON (not prose in braces) that _parse_plan_content can use."""
+        try:
+            value = _json_loads("".join(self.value))
+        except ValueError:
+            return False
+        return isinstance(value, dict) or (isinstance(value, list) and any(isinstance(item, dict) for item in value))
+
+def _read_plan_stream(stream) -> str:
+    """Collects a streamed chat reply, closing the stream (which stops generation) once the JSON plan closes."""
+    parts = []
+    watcher = _JsonValueWatcher()
+    try:
+        for chunk in stream:
+            text = chunk['message']['content']
+            parts.append(text)
+            if watcher.feed(text):
+                break
+    finally:
+        stream.close()
+    return "".join(parts)
+
+async def _read_plan_stream_async(stream) -> str:
+    """Async variant of _read_plan_stream."""
+    parts = []
+    watcher = _JsonValueWatcher()
+    try:
+        async for chunk in stream:
+            text = chunk['message']['content']
+            parts.append(text)
+            if watcher.feed(text):
+                break
+    finally:
+        await stream.aclose()
+    return "".join(parts)
+
+_JSON_DECODER = json.JSONDecoder()
+
+def _json_values(content: str) -> List:
+    """
+    Decodes every JSON object or array embedded in content, in order, skipping the text between them.
+    A single scan: each value is parsed once by raw_decode, and find() jumps to the next candidate start.
+    """
+    values = []
+    idx = 0
+    while True:
+        brace = content.find('{', idx)
+        bracket = content.find('[', idx)
+        if brace < 0 and bracket < 0:
+            return values
+        start = bracket if brace < 0 or 0 <= bracket < brace else brace
+        try:
+            value, idx = _JSON_DECODER.raw_decode(content, start)
+        except json.JSONDecodeError:
+            idx = start + 1 # Not a complete value here; try the next candidate
+            continue
+        values.append(value)
+
+def _parse_plan_content(content: str, cache_key: Optional[Tuple[str, str]] = None) -> Dict:
+    """
+    Extracts, merges and validates the JSON plan in a raw model reply, falling back to a default plan.
+    With cache_key, a reply whose JSON held every plan field is also cached (see _cache_plan).
+    """
+    print("\n=== DEBUG: Raw Response ===")
+    print(content)
+    print("=== End Raw Response ===\n")
+    
+    # Clean the response to ensure it's valid JSON
+    content = content.strip()
+    print("\n=== DEBUG: After strip ===")
+    print(content)
+    print("=== End After strip ===\n")
+    
+    # Split the content into individual JSON objects
+    json_objects = _json_values(content)
+    
+    # Combine the JSON objects into a single response
+    combined_response = {
+        "treatment_plan": [],
+        "lifestyle_advice": [],
+        "diet_recommendations": [],
+        "sleep_recommendations": [],
+        "environmental_factors": [],
+        "product_recommendations": []
+    }
+    
+    for obj in json_objects:
+        if isinstance(obj, list):
+            for item in obj:
+                if isinstance(item, dict):
+                    if "date" in item and "treatment" in item:
+                        combined_response["treatment_plan"].append(item)
+                    elif "skin_condition" in item:
+                        combined_response["product_recommendations"].append(item)
+        elif isinstance(obj, dict):
+            for key in obj:
+                if key in combined_response:
+                    if isinstance(obj[key], list):
+                        combined_response[key].extend(obj[key])
+                    else:
+                        combined_response[key].append(obj[key])
+    
+    print("\n=== DEBUG: Combined JSON ===")
+    print(_json_dumps(combined_response).decode())
+    print("=== End Combined JSON ===\n")
+    
+    # Validate the final response structure (already parsed: no dump/load round trip)
+    try:
+        parsed_response = combined_response
+        # Whether the model's own JSON covered the whole schema, before gaps are filled in below
+        complete = all(
+            any(isinstance(obj, dict) and field in obj for obj in json_objects)
+            for field in _PLAN_FIELDS
+        )
+        
+        # Ensure all required fields are present and are lists
+        for field in _PLAN_FIELDS:
+            if field not in parsed_response:
+                parsed_response[field] = []
+            elif not isinstance(parsed_response[field], list):
+                parsed_response[field] = [parsed_response[field]]
+        
+        # Ensure treatment_plan items have the correct structure
+        for treatment in parsed_response["treatment_plan"]:
+            if not isinstance(treatment, dict):
+                continue
+            if "date" not in treatment:
+                treatment["date"] = datetime.now().strftime("%Y-%m-%d")
+            if "treatment" not in treatment:
+                treatment["treatment"] = "Basic skincare routine"
+        
+        # Ensure product_recommendations items have the correct structure
+        for product in parsed_response["product_recommendations"]:
+            if not isinstance(product, dict):
+                continue
+            if "product_type" not in product:
+                product["product_type"] = "cleanser"
+        
+        if complete and cache_key is not None:
+            _cache_plan(cache_key, parsed_response)
+        return parsed_response  # Return Python object instead of JSON string
+    except Exception as e:
+        print(f"\n=== DEBUG: Response validation error ===")
+        print(f"Error: {str(e)}")
+        print("=== End Response validation error ===\n")
+        # Return default response if validation fails
+        return _default_plan()
+
+def _model_error_plan(e: Exception) -> Dict:
+    """Logs a failed model call and returns the default plan."""
+    print("\n=== DEBUG: General Exception ===")
+    print(f"Exception type: {type(e).__name__}")
+    print(f"Exception message: {str(e)}")
+    print("=== End General Exception ===\n")
+    print("DEFAULT RESPONSE !!")
+
+    # If there's any error with the model, return the default response
+    return _default_plan()
+
 def generate_skin_plan(
     user_profile: Dict,
     timeseries_data: Optional[Dict] = None,
-    model_name: str = 'medllama2'
-) -> str:
+    model_name: str = DEFAULT_PLAN_MODEL
+) -> Dict:
     """
     Generates a treatment plan and lifestyle advice using Ollama's model based on user profile and timeseries data.
 
@@ -27,7 +514,7 @@ def generate_skin_plan(
         model_name: Name of the Ollama model to use
 
     Returns:
-        JSON-formatted string with keys:
+        Plan dictionary with keys:
         - treatment_plan: list of {date: str, treatment: str}
         - lifestyle_advice: list of advice strings
         - diet_recommendations: list of diet-specific recommendations
@@ -41,268 +528,151 @@ def generate_skin_plan(
             - constitution: list of str
             - product_type: str
     """
-    # Extract and process user profile data
-    age = calculate_age(user_profile.get("dob", ""))
-    gender = user_profile.get("gender", "")
-    weight = user_profile.get("weight", 0)
-    height = user_profile.get("height", 0)
-    
-    # Process timeseries data if available
-    severity_score = timeseries_data.get("acne_severity_score", 50) if timeseries_data else 50
-    diet_sugar = timeseries_data.get("diet_sugar", 0) if timeseries_data else 0
-    diet_dairy = timeseries_data.get("diet_dairy", 0) if timeseries_data else 0
-    diet_alcohol = timeseries_data.get("diet_alcohol", 0) if timeseries_data else 0
-    sleep_hours = timeseries_data.get("sleep_hours", 0) if timeseries_data else 0
-    sleep_quality = timeseries_data.get("sleep_quality", "unknown") if timeseries_data else "unknown"
-    stress = timeseries_data.get("stress", 0) if timeseries_data else 0
-    products_used = timeseries_data.get("products_used", "") if timeseries_data else ""
-    sunlight_exposure = timeseries_data.get("sunlight_exposure", 0) if timeseries_data else 0
-    
-    prompt = (
-        f"You are a knowledgeable medical assistant specializing in dermatology. Given the patient data below, provide a JSON response with the following structure:\n"
-        f"{{\n"
-        f"  \"treatment_plan\": [{{\n"
-        f"    \"date\": \"YYYY-MM-DD\",\n"
-        f"    \"treatment\": \"treatment description\"\n"
-        f"  }}],\n"
-        f"  \"lifestyle_advice\": [\"advice 1\", \"advice 2\"],\n"
-        f"  \"diet_recommendations\": [\"diet rec 1\", \"diet rec 2\"],\n"
-        f"  \"sleep_recommendations\": [\"sleep rec 1\", \"sleep rec 2\"],\n"
-        f"  \"environmental_factors\": [\"env factor 1\", \"env factor 2\"],\n"
-        f"  \"product_recommendations\": [{{\n"
-        f"    \"skin_condition\": \"acne/rosacea/dryness/etc\",\n"
-        f"    \"skin_type\": \"oily/dry/combination/sensitive\",\n"
-        f"    \"characteristics\": [\"non-comedogenic\", \"fragrance-free\", etc],\n"
-        f"    \"price_range\": \"budget/mid-range/premium\",\n"
-        f"    \"constitution\": [\"oil-free\", \"alcohol-free\", etc],\n"
-        f"    \"product_type\": \"cleanser/moisturizer/serum/etc\"\n"
-        f"  }}]\n"
-        f"}}\n\n"
-        f"Patient Data:\n"
-        f"- Age: {age}\n"
-        f"- Gender: {gender}\n"
-        f"- Weight (kg): {weight}\n"
-        f"- Height (cm): {height}\n"
-        f"- Acne Severity Score (1-100): {severity_score}\n"
-        f"- Current Diet Patterns:\n"
-        f"  * Sugar intake: {diet_sugar}%\n"
-        f"  * Dairy intake: {diet_dairy}%\n"
-        f"  * Alcohol consumption: {diet_alcohol}%\n"
-        f"- Sleep Patterns:\n"
-        f"  * Hours: {sleep_hours}\n"
-        f"  * Quality: {sleep_quality}\n"
-        f"- Stress Level (1-10): {stress}\n"
-        f"- Current Products Used: {products_used}\n"
-        f"- Sunlight Exposure (hours/day): {sunlight_exposure}\n\n"
-        f"IMPORTANT: Your response must be a valid JSON object. Do not include any text before or after the JSON. "
-        f"Make sure all strings are properly quoted with double quotes. "
-        f"Arrays must be enclosed in square brackets. "
-        f"Objects must be enclosed in curly braces. "
-        f"All keys must be strings enclosed in double quotes. "
-        f"Provide ONLY the JSON response with NO additional text or explanation."
-    )
-
     try:
-        response = ollama.chat(
+        messages = _plan_messages(user_profile, timeseries_data)
+        cache_key = (model_name, messages[-1]['content'])
+        plan = _cached_plan(cache_key)
+        if plan is not None:
+            return plan
+        # Streamed, so generation stops as soon as the plan's JSON object is complete
+        stream = _client().chat(
             model=model_name,
-            messages=[
-                {'role': 'system', 'content': 'You are a dermatology expert. You must respond with valid JSON only. Do not include any text before or after the JSON.'},
-                {'role': 'user', 'content': prompt}
-            ],
-            options={
-                'temperature': 0.7,
-                'top_p': 0.9,
-                'max_tokens': 1024,
-                'num_ctx': 2048
-            }
+            messages=messages,
+            options=_PLAN_OPTIONS,
+            keep_alive=_KEEP_ALIVE,
+            stream=True
         )
-        
-        # Get the response content
-        content = response['message']['content']
-        print("\n=== DEBUG: Raw Response ===")
-        print(content)
-        print("=== End Raw Response ===\n")
-        
-        # Clean the response to ensure it's valid JSON
-        content = content.strip()
-        print("\n=== DEBUG: After strip ===")
-        print(content)
-        print("=== End After strip ===\n")
-        
-        # Split the content into individual JSON objects
-        json_objects = []
-        current_object = ""
-        brace_count = 0
-        for char in content:
-            current_object += char
-            if char == '{':
-                brace_count += 1
-            elif char == '}':
-                brace_count -= 1
-                if brace_count == 0:
-                    try:
-                        json_objects.append(json.loads(current_object))
-                        current_object = ""
-                    except json.JSONDecodeError:
-                        current_object = ""
-        
-        # Combine the JSON objects into a single response
-        combined_response = {
-            "treatment_plan": [],
-            "lifestyle_advice": [],
-            "diet_recommendations": [],
-            "sleep_recommendations": [],
-            "environmental_factors": [],
-            "product_recommendations": []
-        }
-        
-        for obj in json_objects:
-            if isinstance(obj, list):
-                for item in obj:
-                    if isinstance(item, dict):
-                        if "date" in item and "treatment" in item:
-                            combined_response["treatment_plan"].append(item)
-                        elif "skin_condition" in item:
-                            combined_response["product_recommendations"].append(item)
-            elif isinstance(obj, dict):
-                for key in obj:
-                    if key in combined_response:
-                        if isinstance(obj[key], list):
-                            combined_response[key].extend(obj[key])
-                        else:
-                            combined_response[key].append(obj[key])
-        
-        # Convert the combined response to JSON string
-        content = json.dumps(combined_response)
-        print("\n=== DEBUG: Combined JSON ===")
-        print(content)
-        print("=== End Combined JSON ===\n")
-        
-        # Validate the final response structure
+        return _parse_plan_content(_read_plan_stream(stream), cache_key)
+    except Exception as e:
+        return _model_error_plan(e)
+
+def _ollama_slots() -> asyncio.Semaphore:
+    """The running loop's semaphore admitting _OLLAMA_PARALLEL plan calls at once."""
+    return _per_loop('slots', lambda: asyncio.Semaphore(_OLLAMA_PARALLEL))
+
+def _is_transient(e: Exception) -> bool:
+    """True for errors worth retrying: the server was unreachable or timed out, or answered 429 or 5xx."""
+    import httpx
+    if isinstance(e, (ConnectionError, httpx.ConnectError, httpx.TimeoutException)):
+        return True
+    if isinstance(e, httpx.HTTPStatusError):
+        status_code = e.response.status_code
+    else:
+        # ollama.ResponseError carries the status code itself
+        status_code = getattr(e, 'status_code', None) or 0
+    return status_code == 429 or status_code >= 500
+
+async def _chat_async(model_name: str, messages: List[Dict]) -> str:
+    """Streams one plan reply from Ollama, holding an _ollama_slots() slot and retrying transient errors."""
+    for attempt in range(_RETRIES + 1):
         try:
-            parsed_response = json.loads(content)
-            required_fields = [
-                "treatment_plan",
-                "lifestyle_advice",
-                "diet_recommendations",
-                "sleep_recommendations",
-                "environmental_factors",
-                "product_recommendations"
-            ]
-            
-            # Ensure all required fields are present and are lists
-            for field in required_fields:
-                if field not in parsed_response:
-                    parsed_response[field] = []
-                elif not isinstance(parsed_response[field], list):
-                    parsed_response[field] = [parsed_response[field]]
-            
-            # Ensure treatment_plan items have the correct structure
-            for treatment in parsed_response["treatment_plan"]:
-                if not isinstance(treatment, dict):
-                    continue
-                if "date" not in treatment:
-                    treatment["date"] = datetime.now().strftime("%Y-%m-%d")
-                if "treatment" not in treatment:
-                    treatment["treatment"] = "Basic skincare routine"
-            
-            # Ensure product_recommendations items have the correct structure
-            for product in parsed_response["product_recommendations"]:
-                if not isinstance(product, dict):
-                    continue
-                if "product_type" not in product:
-                    product["product_type"] = "cleanser"
-            
-            return parsed_response  # Return Python object instead of JSON string
+            async with _ollama_slots():
+                stream = await _async_client().chat(
+                    model=model_name,
+                    messages=messages,
+                    options=_PLAN_OPTIONS,
+                    keep_alive=_KEEP_ALIVE,
+                    stream=True
+                )
+                return await _read_plan_stream_async(stream)
         except Exception as e:
-            print(f"\n=== DEBUG: Response validation error ===")
-            print(f"Error: {str(e)}")
-            print("=== End Response validation error ===\n")
-            # Return default response if validation fails
-            default_response = {
-                "treatment_plan": [
-                    {
-                        "date": datetime.now().strftime("%Y-%m-%d"),
-                        "treatment": "Basic skincare routine: gentle cleanser, moisturizer, and sunscreen"
-                    }
-                ],
-                "lifestyle_advice": [
-                    "Stay hydrated",
-                    "Get adequate sleep",
-                    "Manage stress levels"
-                ],
-                "diet_recommendations": [
-                    "Reduce sugar intake",
-                    "Maintain a balanced diet",
-                    "Consider reducing dairy consumption"
-                ],
-                "sleep_recommendations": [
-                    "Aim for 7-9 hours of sleep",
-                    "Maintain a consistent sleep schedule"
-                ],
-                "environmental_factors": [
-                    "Protect skin from sun exposure",
-                    "Keep environment clean and dust-free"
-                ],
-                "product_recommendations": [
-                    {
-                        "skin_condition": "acne",
-                        "skin_type": "combination",
-                        "characteristics": ["non-comedogenic", "fragrance-free"],
-                        "price_range": "mid-range",
-                        "constitution": ["oil-free", "alcohol-free"],
-                        "product_type": "cleanser"
-                    }
-                ]
-            }
-            return default_response  # Return Python object instead of JSON string
+            if attempt == _RETRIES or not _is_transient(e):
+                raise
+            await asyncio.sleep(_RETRY_BACKOFF * 2 ** attempt)
+
+async def generate_skin_plan_async(
+    user_profile: Dict,
+    timeseries_data: Optional[Dict] = None,
+    model_name: str = DEFAULT_PLAN_MODEL
+) -> Dict:
+    """
+    Async variant of generate_skin_plan: awaits the shared AsyncClient, so a server can have
+    several patients' plans in flight at once (up to OLLAMA_NUM_PARALLEL, the number Ollama runs together).
+    """
+    try:
+        messages = _plan_messages(user_profile, timeseries_data)
+        cache_key = (model_name, messages[-1]['content'])
+        plan = _cached_plan(cache_key)
+        if plan is not None:
+            return plan
+        return _parse_plan_content(await _chat_async(model_name, messages), cache_key)
     except Exception as e:
-        print("\n=== DEBUG: General Exception ===")
-        print(f"Exception type: {type(e).__name__}")
-        print(f"Exception message: {str(e)}")
-        print("=== End General Exception ===\n")
-        print("DEFAULT RESPONSE !!")
-
-        # If there's any error with the model, return the default response
-        default_response = {
-            "treatment_plan": [
-                {
-                    "date": datetime.now().strftime("%Y-%m-%d"),
-                    "treatment": "Basic skincare routine: gentle cleanser, moisturizer, and sunscreen"
-                }
-            ],
-            "lifestyle_advice": [
-                "Stay hydrated",
-                "Get adequate sleep",
-                "Manage stress levels"
-            ],
-            "diet_recommendations": [
-                "Reduce sugar intake",
-                "Maintain a balanced diet",
-                "Consider reducing dairy consumption"
-            ],
-            "sleep_recommendations": [
-                "Aim for 7-9 hours of sleep",
-                "Maintain a consistent sleep schedule"
-            ],
-            "environmental_factors": [
-                "Protect skin from sun exposure",
-                "Keep environment clean and dust-free"
-            ],
-            "product_recommendations": [
-                {
-                    "skin_condition": "acne",
-                    "skin_type": "combination",
-                    "characteristics": ["non-comedogenic", "fragrance-free"],
-                    "price_range": "mid-range",
-                    "constitution": ["oil-free", "alcohol-free"],
-                    "product_type": "cleanser"
-                }
-            ]
-        }
-        return default_response  # Return Python object instead of JSON string
+        return _model_error_plan(e)
+
+def _vllm_request(messages: List[Dict], model_name: str) -> Dict:
+    """Builds the OpenAI-style chat completion body for a vLLM server, with the same sampling as the Ollama path."""
+    return {
+        'model': model_name,
+        'messages': messages,
+        'max_tokens': _CHAT_OPTIONS['num_predict'],
+        'temperature': _CHAT_OPTIONS['temperature'],
+        'top_p': _CHAT_OPTIONS['top_p']
+    }
+
+def _vllm_content(response: "httpx.Response") -> str:
+    """Returns the reply text of a chat completion response."""
+    response.raise_for_status()
+    return response.json()['choices'][0]['message']['content']
+
+def generate_skin_plan_vllm(
+    user_profile: Dict,
+    timeseries_data: Optional[Dict] = None,
+    model_name: str = DEFAULT_PLAN_MODEL
+) -> Dict:
+    """Variant of generate_skin_plan that generates with the vLLM server at VLLM_BASE_URL."""
+    try:
+        messages = _plan_messages(user_profile, timeseries_data)
+        cache_key = (model_name, messages[-1]['content'])
+        plan = _cached_plan(cache_key)
+        if plan is not None:
+            return plan
+        response = _vllm_client().post('/chat/completions', json=_vllm_request(messages, model_name))
+        return _parse_plan_content(_vllm_content(response), cache_key)
+    except Exception as e:
+        return _model_error_plan(e)
+
+async def generate_skin_plan_vllm_async(
+    user_profile: Dict,
+    timeseries_data: Optional[Dict] = None,
+    model_name: str = DEFAULT_PLAN_MODEL
+) -> Dict:
+    """Async variant of generate_skin_plan_vllm; concurrent calls are batched by the vLLM server."""
+    try:
+        messages = _plan_messages(user_profile, timeseries_data)
+        cache_key = (model_name, messages[-1]['content'])
+        plan = _cached_plan(cache_key)
+        if plan is not None:
+            return plan
+        response = await _vllm_async_client().post('/chat/completions', json=_vllm_request(messages, model_name))
+        return _parse_plan_content(_vllm_content(response), cache_key)
+    except Exception as e:
+        return _model_error_plan(e)
 
-def generate_skin_plan_from_json(input_json: dict) -> str:
+async def preload_skin_model_async(model_name: str = DEFAULT_PLAN_MODEL) -> bool:
+    """
+    Loads model_name into Ollama ahead of the first plan request, and keeps it loaded like the plan
+    calls do. The warm-up is a one-token chat on a default patient, so the KV of the shared prompt
+    prefix is already cached (and with the same num_ctx, so the first real request doesn't reload the model).
+
+    Returns:
+        True if the model is loaded, False if Ollama could not be reached or load it
+    """
+    try:
+        messages = [_SYSTEM_MESSAGE, {'role': 'user', 'content': _STATIC_PROMPT_HEADER + _PATIENT_SECTION_TEMPLATE.format_map({
+            **_TS_DEFAULTS, "age": 30, "gender": "", "weight": 0, "height": 0
+        })}]
+        await _async_client().chat(
+            model=model_name,
+            messages=messages,
+            options={**_PLAN_OPTIONS, 'num_predict': 1},
+            keep_alive=_KEEP_ALIVE
+        )
+        return True
+    except Exception as e:
+        print(f"Could not preload Ollama model '{model_name}': {e}")
+        return False
+
+def generate_skin_plan_from_json(input_json: dict) -> Dict:
     """
     Wrapper: Parses a JSON dict containing user profile and timeseries data and generates the skin plan.
     
@@ -311,23 +681,45 @@ def generate_skin_plan_from_json(input_json: dict) -> str:
             - user_profile: Dictionary with user profile data
             - timeseries_data: Optional dictionary with latest timeseries data
             - model_name: Optional name of the Ollama model to use
+            - backend: Optional "ollama" (default) or "vllm" (see VLLM_BASE_URL)
     
     Returns:
-        JSON-formatted string with the generated plan
+        Plan dictionary (see generate_skin_plan)
     """
     if "user_profile" not in input_json:
         raise ValueError("Missing required key 'user_profile' in input JSON")
     
     user_profile = input_json["user_profile"]
     timeseries_data = input_json.get("timeseries_data")
-    model_name = input_json.get("model_name", 'medllama2')
+    model_name = input_json.get("model_name", DEFAULT_PLAN_MODEL)
+    generate = generate_skin_plan_vllm if input_json.get("backend", "ollama") == "vllm" else generate_skin_plan
 
-    return generate_skin_plan(
+    return generate(
         user_profile=user_profile,
         timeseries_data=timeseries_data,
         model_name=model_name
     )
 
+async def generate_skin_plans_from_json(input_jsons: List[dict]) -> List[Dict]:
+    """
+    Batch wrapper: generates one plan per input JSON (see generate_skin_plan_from_json) concurrently.
+
+    Returns:
+        Plans in the same order as input_jsons
+    """
+    for input_json in input_jsons:
+        if "user_profile" not in input_json:
+            raise ValueError("Missing required key 'user_profile' in input JSON")
+
+    return await asyncio.gather(*(
+        (generate_skin_plan_vllm_async if input_json.get("backend", "ollama") == "vllm" else generate_skin_plan_async)(
+            user_profile=input_json["user_profile"],
+            timeseries_data=input_json.get("timeseries_data"),
+            model_name=input_json.get("model_name", DEFAULT_PLAN_MODEL)
+        )
+        for input_json in input_jsons
+    ))
+
 def test_generate_skin_plan():
     """
     Test using sample JSON with user profile and timeseries data.
@@ -391,6 +783,7 @@ def search_products_google(query, api_key, num_results=5):
         "hl": "en",
         "gl": "us"
     }
+    import requests
     response = requests.get("https://serpapi.com/search", params=params)
     results = response.json()
     # print(json.dumps(results.get("shopping_results", []), indent=2))
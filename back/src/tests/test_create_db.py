@@ -13,7 +13,13 @@ if src_path not in sys.path:
     sys.path.append(src_path)
 
 # Import the functions to test
-from src.db.create_db import create_timeseries_table, create_profiles_table, setup_databases
+from src.db.create_db import create_timeseries_table, create_profiles_table, setup_databases, get_latest_timeseries_data, get_latest_timeseries_df, encode_products, dump_products, insert_test_data, close_pools, get_conn, MEMORY_DB
+
+@pytest.fixture(autouse=True)
+def fresh_pools():
+    """Close pooled connections after each test, whose temporary files are then removed"""
+    yield
+    close_pools()
 
 @pytest.fixture
 def temp_timeseries_db():
@@ -53,6 +59,15 @@ def test_create_timeseries_table(temp_timeseries_db):
     ]
     
     assert all(col in column_names for col in expected_columns)
+    
+    # Check the per-user query is served by the composite index without a sort
+    cursor.execute(
+        "EXPLAIN QUERY PLAN SELECT * FROM timeseries WHERE user_id = ? ORDER BY timestamp",
+        ("user_1",)
+    )
+    plan = " ".join(row[-1] for row in cursor.fetchall())
+    assert "idx_ts_user_time" in plan
+    assert "TEMP B-TREE" not in plan
     conn.close()
 
 def test_create_profiles_table(temp_profiles_db):
@@ -111,4 +126,112 @@ def test_setup_databases(temp_timeseries_db, temp_profiles_db):
     assert cursor_prof.fetchone()[0] > 0
     
     conn_ts.close()
-    conn_prof.close() 
\ No newline at end of file
+    conn_prof.close()
+
+def test_get_latest_timeseries_data_by_product(temp_timeseries_db):
+    """Test filtering timeseries entries on the products bitmask"""
+    create_timeseries_table(temp_timeseries_db)
+    
+    conn = sqlite3.connect(temp_timeseries_db)
+    for day, products in enumerate(["cleanser", "CeraVe Cleanser, SPF 50 Sunscreen", ""], start=1):
+        conn.execute(
+            "INSERT INTO timeseries (id, user_id, timestamp, products_used, products_mask) VALUES (?, ?, ?, ?, ?)",
+            (str(uuid.uuid4()), "product_user", f"2024-05-0{day}T10:00:00", dump_products(products), encode_products(products))
+        )
+    conn.commit()
+    conn.close()
+    
+    assert len(get_latest_timeseries_data("product_user", temp_timeseries_db)) == 3
+    assert len(get_latest_timeseries_data("product_user", temp_timeseries_db, product="cleanser")) == 2
+    
+    sunscreen_entries = get_latest_timeseries_data("product_user", temp_timeseries_db, product="sunscreen")
+    assert [entry["timestamp"] for entry in sunscreen_entries] == ["2024-05-02T10:00:00"]
+    assert sunscreen_entries[0]["products_used"] == ["CeraVe Cleanser", "SPF 50 Sunscreen"]
+    
+    with pytest.raises(ValueError):
+        get_latest_timeseries_data("product_user", temp_timeseries_db, product="unknown")
+
+def test_get_latest_timeseries_data_legacy_schema(temp_timeseries_db):
+    """Test reading a database created before products_mask without running create_timeseries_table"""
+    conn = sqlite3.connect(temp_timeseries_db)
+    conn.execute(
+        "CREATE TABLE timeseries (id TEXT PRIMARY KEY, user_id TEXT NOT NULL, timestamp TEXT NOT NULL, "
+        "acne_severity_score REAL DEFAULT 0, diet_sugar REAL DEFAULT 0, diet_dairy REAL DEFAULT 0, "
+        "diet_alcohol REAL DEFAULT 0, sleep_hours REAL DEFAULT 0, sleep_quality TEXT DEFAULT 'unknown', "
+        "menstrual_cycle_active INTEGER DEFAULT 0, menstrual_cycle_day INTEGER DEFAULT 0, latitude REAL DEFAULT 0, "
+        "longitude REAL DEFAULT 0, humidity REAL DEFAULT 0, pollution REAL DEFAULT 0, stress REAL DEFAULT 0, "
+        "products_used TEXT DEFAULT '', sunlight_exposure REAL DEFAULT 0)"
+    )
+    conn.execute(
+        "INSERT INTO timeseries (id, user_id, timestamp, products_used) VALUES (?, ?, ?, ?)",
+        (str(uuid.uuid4()), "legacy_user", "2024-05-01T10:00:00", "cleanser,sunscreen")
+    )
+    conn.commit()
+    conn.close()
+    
+    entries = get_latest_timeseries_data("legacy_user", temp_timeseries_db, product="sunscreen")
+    assert [entry["products_used"] for entry in entries] == [["cleanser", "sunscreen"]]
+
+def test_get_latest_timeseries_data_comma_separated_products(temp_timeseries_db):
+    """Test that products_used text that isn't a JSON array is still read as a list"""
+    create_timeseries_table(temp_timeseries_db)
+    
+    conn = sqlite3.connect(temp_timeseries_db)
+    conn.execute(
+        "INSERT INTO timeseries (id, user_id, timestamp, products_used) VALUES (?, ?, ?, ?)",
+        (str(uuid.uuid4()), "text_user", "2024-05-01T10:00:00", "cleanser, toner")
+    )
+    conn.commit()
+    conn.close()
+    
+    entries = get_latest_timeseries_data("text_user", temp_timeseries_db)
+    assert [entry["products_used"] for entry in entries] == [["cleanser", "toner"]]
+
+def test_get_latest_timeseries_data_replaced_file(tmp_path):
+    """Test that pooled connections to a replaced database file are dropped by close_pools"""
+    db_path = str(tmp_path / "acne_tracker.db")
+    insert_test_data(db_path)
+    assert len(get_latest_timeseries_data("test_user_1", db_path)) == 3
+    
+    # Swap in an empty database, as a rebuild would
+    empty_db_path = str(tmp_path / "empty.db")
+    create_timeseries_table(empty_db_path)
+    os.replace(empty_db_path, db_path)
+    close_pools()
+    
+    assert get_latest_timeseries_data("test_user_1", db_path) == []
+
+def test_get_conn_drops_idle_connections_on_error(temp_timeseries_db):
+    """Test that an OperationalError closes the path's idle pooled connections"""
+    insert_test_data(temp_timeseries_db)
+    with get_conn(temp_timeseries_db, readonly=True) as first, get_conn(temp_timeseries_db, readonly=True) as second:
+        pass
+    
+    with pytest.raises(sqlite3.OperationalError):
+        with get_conn(temp_timeseries_db, readonly=True) as conn:
+            conn.execute("SELECT missing_column FROM timeseries")
+    
+    # The other idle connection was closed rather than handed out again
+    with get_conn(temp_timeseries_db, readonly=True) as conn:
+        assert conn is not first and conn is not second
+
+def test_get_latest_timeseries_df(temp_timeseries_db):
+    """Test reading a user's timeseries entries into a DataFrame"""
+    pd = pytest.importorskip("pandas")
+    insert_test_data(temp_timeseries_db)
+    
+    df = get_latest_timeseries_df("test_user_1", temp_timeseries_db)
+    records = get_latest_timeseries_data("test_user_1", temp_timeseries_db)
+    
+    assert len(df) == len(records) == 3
+    assert pd.api.types.is_datetime64_any_dtype(df["timestamp"])
+    assert df["timestamp"].is_monotonic_increasing
+    assert list(df["acne_severity_score"]) == [entry["acne_severity_score"] for entry in records]
+
+def test_setup_databases_in_memory():
+    """Test setting up and seeding the shared in-memory database"""
+    setup_databases(use_memory=True)
+    insert_test_data(MEMORY_DB)
+    
+    entries = get_latest_timeseries_data("test_user_1", MEMORY_DB)
+    assert [entry["acne_severity_score"] for entry in entries] == [75.0, 70.0, 65.0]
@@ -0,0 +1,144 @@
+import sys
+import json
+from pathlib import Path
+import pytest
+
+# Add the src directory to the Python path
+src_path = str(Path(__file__).parent.parent)
+if src_path not in sys.path:
+    sys.path.append(src_path)
+
+# Import the functions to test
+import src.solutions.medllama as medllama
+from src.solutions.medllama import _json_values, _JsonValueWatcher, _read_plan_stream, _cached_plan, _cache_plan, generate_skin_plan
+
+PLAN = {
+    "treatment_plan": [{"date": "2025-01-01", "treatment": "gentle cleanser"}],
+    "lifestyle_advice": ["Drink more water"],
+    "diet_recommendations": ["Less sugar"],
+    "sleep_recommendations": ["Sleep 8 hours"],
+    "environmental_factors": ["Use sunscreen"],
+    "product_recommendations": [{"skin_condition": "acne", "product_type": "cleanser"}]
+}
+
+@pytest.fixture(autouse=True)
+def empty_plan_cache():
+    """Start and end each test with an empty plan cache"""
+    medllama._plan_cache.clear()
+    yield
+    medllama._plan_cache.clear()
+
+class _FakeStream:
+    """Stands in for a streamed Ollama chat reply"""
+    def __init__(self, pieces):
+        self.pieces = pieces
+        self.read = 0
+        self.closed = False
+    def __iter__(self):
+        for piece in self.pieces:
+            self.read += 1
+            yield {"message": {"content": piece}}
+    def close(self):
+        self.closed = True
+
+def _pieces(text, size=7):
+    """Splits text into stream-sized pieces"""
+    return [text[i:i + size] for i in range(0, len(text), size)]
+
+def test_json_values_prose_around_json():
+    """Test that text before and after the JSON is skipped"""
+    content = 'Sure! Here is the plan {as requested}:\n{"lifestyle_advice": ["Sleep more"]}\nHope it helps.'
+    assert _json_values(content) == [{"lifestyle_advice": ["Sleep more"]}]
+
+def test_json_values_several_objects():
+    """Test that every object in a reply is returned, in order"""
+    content = '{"lifestyle_advice": ["a"]}\n\n{"diet_recommendations": ["b"]}'
+    assert _json_values(content) == [{"lifestyle_advice": ["a"]}, {"diet_recommendations": ["b"]}]
+
+def test_json_values_top_level_array():
+    """Test that a top-level array is returned whole, not as its inner objects"""
+    content = '[{"date": "2025-01-01", "treatment": "cleanser"}, {"date": "2025-01-02", "treatment": "serum"}]'
+    assert _json_values(content) == [[
+        {"date": "2025-01-01", "treatment": "cleanser"},
+        {"date": "2025-01-02", "treatment": "serum"}
+    ]]
+
+def test_json_values_braces_in_strings():
+    """Test that braces and brackets inside strings don't split the value"""
+    content = '{"treatment_plan": [{"date": "2025-01-01", "treatment": "use {gentle} [fragrance-free] \\"soap\\" }"}]}'
+    assert _json_values(content) == [{"treatment_plan": [{"date": "2025-01-01", "treatment": 'use {gentle} [fragrance-free] "soap" }'}]}]
+
+def test_json_values_truncated_reply():
+    """Test that a reply cut off mid-value yields only its complete inner values"""
+    content = '{"lifestyle_advice": ["Sleep more"], "diet_recommendations": ["Less sug'
+    assert _json_values(content) == [["Sleep more"]]
+
+@pytest.mark.parametrize("content, stop_after", [
+    ('Here is {your} plan: {"lifestyle_advice": ["a"]} trailing', '{"lifestyle_advice": ["a"]}'),
+    ('{"lifestyle_advice": ["a"]}{"diet_recommendations": ["b"]}', '{"lifestyle_advice": ["a"]}'),
+    ('[{"date": "2025-01-01", "treatment": "x"}, {"skin_condition": "acne"}] more', '{"skin_condition": "acne"}]'),
+    ('See [1] and {"treatment_plan": [{"date": "d", "treatment": "t { ] \\" }"}]} end', 't { ] \\" }"}]}'),
+])
+def test_watcher_stops_after_first_plan_value(content, stop_after):
+    """Test that the watcher fires exactly when the first value that can hold a plan closes"""
+    end = content.index(stop_after) + len(stop_after)
+    watcher = _JsonValueWatcher()
+    assert not watcher.feed(content[:end - 1])
+    assert watcher.feed(content[end - 1:])
+
+def test_watcher_truncated_reply():
+    """Test that the watcher never fires on a reply that stops mid-value"""
+    watcher = _JsonValueWatcher()
+    assert not any(watcher.feed(piece) for piece in _pieces('{"lifestyle_advice": ["a"], "diet_recommendations": ["b'))
+
+def test_read_plan_stream_stops_and_closes():
+    """Test that reading stops at the piece that closes the plan and closes the stream"""
+    reply = 'Plan {below}: [{"date": "2025-01-01", "treatment": "x"}] {"lifestyle_advice": ["ignored"]}'
+    stream = _FakeStream(_pieces(reply))
+    content = _read_plan_stream(stream)
+    assert stream.closed
+    assert stream.read < len(stream.pieces)
+    assert _json_values(content)[-1] == [{"date": "2025-01-01", "treatment": "x"}]
+
+def test_plan_cache_hit_returns_copy():
+    """Test that a cached plan is returned as a fresh copy"""
+    _cache_plan(("model", "prompt"), PLAN)
+    plan = _cached_plan(("model", "prompt"))
+    assert plan == PLAN
+    plan["lifestyle_advice"].append("changed")
+    assert _cached_plan(("model", "prompt")) == PLAN
+    assert _cached_plan(("model", "other prompt")) is None
+
+def test_plan_cache_evicts_least_recently_used(monkeypatch):
+    """Test that the least recently used plan is evicted once the cache is full"""
+    monkeypatch.setattr(medllama, "_PLAN_CACHE_SIZE", 2)
+    _cache_plan(("model", "a"), PLAN)
+    _cache_plan(("model", "b"), PLAN)
+    assert _cached_plan(("model", "a")) is not None  # "a" is now the most recently used
+    _cache_plan(("model", "c"), PLAN)
+    assert _cached_plan(("model", "b")) is None
+    assert _cached_plan(("model", "a")) is not None
+    assert _cached_plan(("model", "c")) is not None
+
+def test_plan_cache_expires(monkeypatch):
+    """Test that expired plans are not served"""
+    monkeypatch.setattr(medllama, "_PLAN_CACHE_TTL", 0.0)
+    _cache_plan(("model", "prompt"), PLAN)
+    assert _cached_plan(("model", "prompt")) is None
+    assert ("model", "prompt") not in medllama._plan_cache
+
+def test_generate_skin_plan_served_from_cache(monkeypatch):
+    """Test that a repeated request is answered from the cache, without another model call"""
+    calls = []
+    class FakeClient:
+        def chat(self, **kwargs):
+            calls.append(kwargs)
+            return _FakeStream(_pieces(json.dumps(PLAN)))
+    monkeypatch.setattr(medllama, "_client", FakeClient)
+    profile = {"dob": "1995-05-03", "gender": "Male", "weight": 75, "height": 180}
+    
+    assert generate_skin_plan(profile, {"acne_severity_score": 40}) == PLAN
+    assert generate_skin_plan(profile, {"acne_severity_score": 40}) == PLAN
+    assert len(calls) == 1
+    generate_skin_plan(profile, {"acne_severity_score": 60})
+    assert len(calls) == 2
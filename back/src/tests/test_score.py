@@ -0,0 +1,59 @@
+import sys
+from pathlib import Path
+import pytest
+
+# Add the src directory to the Python path
+src_path = str(Path(__file__).parent.parent)
+if src_path not in sys.path:
+    sys.path.append(src_path)
+
+np = pytest.importorskip("numpy")
+cv2 = pytest.importorskip("cv2")
+torch = pytest.importorskip("torch")
+pytest.importorskip("ultralytics")
+
+# Import the functions to test
+from src.detection.score import _letterbox, _extract_detections, DEFAULT_ENGINE_IMGSZ
+
+class _Boxes:
+    """Stands in for ultralytics' Boxes: rows of [x1, y1, x2, y2, conf, cls]"""
+    def __init__(self, data):
+        self.data = data
+    def __len__(self):
+        return len(self.data)
+
+class _Result:
+    def __init__(self, boxes, names):
+        self.boxes = boxes
+        self.names = names
+
+@pytest.mark.parametrize("shape", [(480, 320, 3), (300, 900, 3), (640, 640, 3), (1080, 1920, 3)])
+def test_letterboxed_boxes_map_back_to_image(shape):
+    """Test that boxes found on the letterboxed input map back to the original image"""
+    img_h, img_w = shape[:2]
+    boxes = np.array([[0.1 * img_w, 0.2 * img_h, 0.5 * img_w, 0.75 * img_h], [0, 0, img_w, img_h]], dtype=np.float32)
+    image = np.zeros(shape, dtype=np.uint8)
+    x1, y1, x2, y2 = boxes[0].astype(int)
+    image[y1:y2, x1:x2] = 255
+    
+    padded, letterbox = _letterbox(image)
+    assert padded.shape == (DEFAULT_ENGINE_IMGSZ, DEFAULT_ENGINE_IMGSZ, 3)
+    
+    # Where the first box actually lands in the letterboxed input, as a model would see it
+    x, y, w, h = cv2.boundingRect((padded[..., 0] > 200).astype(np.uint8))
+    ratio, (pad_x, pad_y), _ = letterbox
+    outer = np.array([pad_x, pad_y, img_w * ratio + pad_x, img_h * ratio + pad_y], dtype=np.float32)
+    data = torch.tensor([[x, y, x + w, y + h, 0.9, 2], [*outer, 0.8, 3]], dtype=torch.float32)
+    
+    detections = _extract_detections([_Result(_Boxes(data), {2: "papules", 3: "pustules"})], letterbox)
+    # Within the one-pixel rounding of the resize
+    np.testing.assert_allclose(detections["xyxy"], boxes, atol=1.5 / ratio)
+    assert detections["cls"].tolist() == [2, 3]
+    np.testing.assert_allclose(detections["conf"], [0.9, 0.8])
+
+def test_extract_detections_without_letterbox():
+    """Test that boxes are returned as predicted when no letterbox is given"""
+    data = torch.tensor([[10, 20, 30, 40, 0.5, 1]], dtype=torch.float32)
+    detections = _extract_detections([_Result(_Boxes(data), {1: "blackheads"})])
+    np.testing.assert_allclose(detections["xyxy"], [[10, 20, 30, 40]])
+    assert detections["names"] == {1: "blackheads"}
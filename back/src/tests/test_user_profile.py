@@ -12,7 +12,14 @@ if src_path not in sys.path:
     sys.path.append(src_path)
 
 # Import the database module
-from src.db.user_profile_db import init_db, save_profile_to_db, get_profile_from_db, ValidationError
+from src.db.user_profile_db import init_db, save_profile_to_db, save_profiles_to_db, get_profile_from_db, ValidationError
+from src.db.create_db import close_pools
+
+@pytest.fixture(autouse=True)
+def fresh_pools():
+    """Close pooled connections after each test, whose temporary files are then removed"""
+    yield
+    close_pools()
 
 @pytest.fixture
 def temp_db():
@@ -101,6 +108,27 @@ def test_update_existing_profile(temp_db):
     assert retrieved_profile["weight"] == 78.0
     assert retrieved_profile["height"] == initial_profile["height"]  # Unchanged field
 
+def test_save_profiles_batch(temp_db):
+    """Test saving several profiles at once, including an update to an existing one"""
+    save_profile_to_db(db_path=temp_db, user_id="batch_user_1", name="Old Name",
+                       dob="1990-01-01", height=170.0, weight=60.0, gender="Female")
+    
+    save_profiles_to_db([
+        ("batch_user_1", "New Name", "1990-01-01", 170.0, 61.0, "Female"),
+        ("batch_user_2", "Second User", "1985-06-15", 182.0, 80.0, "Male"),
+    ], db_path=temp_db)
+    
+    assert get_profile_from_db("batch_user_1", db_path=temp_db)["name"] == "New Name"
+    assert get_profile_from_db("batch_user_2", db_path=temp_db)["weight"] == 80.0
+    
+    # One invalid row rejects the whole batch
+    with pytest.raises(ValidationError):
+        save_profiles_to_db([
+            ("batch_user_3", "Third User", "2001-02-03", 160.0, 50.0, "Female"),
+            ("batch_user_4", "Bad Dob", "03-02-2001", 160.0, 50.0, "Female"),
+        ], db_path=temp_db)
+    assert get_profile_from_db("batch_user_3", db_path=temp_db) is None
+
 def test_save_profile_with_null_values(temp_db):
     """Test saving a profile with null values for optional fields"""
     profile = {